@@ -1,42 +1,167 @@
+import asyncio, heapq, logging, time
 from aiogram import Bot
 from aiogram.fsm.context import FSMContext
-from apscheduler.schedulers.asyncio import AsyncIOScheduler
-from datetime import datetime, timezone
+from datetime import datetime
+from decouple import config
 
-from .survey_storage import get_due, mark_sent
+from .survey_storage import get_pending, mark_sent_many, subscribe
+from databases import database as db
 from handlers.rate_booking import send_survey_message
 from handlers.register_handlers import dp
 
-scheduler: AsyncIOScheduler | None = None
+logger = logging.getLogger(__name__)
 
-def get_scheduler() -> AsyncIOScheduler:
-    global scheduler
-    if scheduler is None:
-        scheduler = AsyncIOScheduler(timezone="Asia/Tashkent")
-    return scheduler
+## webhook workers add surveys in their own processes; the timer re-reads storage this often to pick them up
+SURVEY_RESYNC_INTERVAL = config("SURVEY_RESYNC_INTERVAL", default=300, cast=int)
+## a failed send is retried after this delay instead of on every tick
+SURVEY_RETRY_DELAY = config("SURVEY_RETRY_DELAY", default=600, cast=int)
+## surveys sent at once; Telegram pacing itself comes from the shared broadcast limiter
+SURVEY_CONCURRENCY = config("SURVEY_CONCURRENCY", default=10, cast=int)
 
 
-def _now_utc_iso() -> str:
-    return datetime.now(timezone.utc).isoformat(timespec="seconds").replace("+00:00", "Z")
+def _to_ts(iso: str) -> float:
+    return datetime.fromisoformat(iso.replace("Z", "+00:00")).timestamp()
 
 async def get_user_context(bot, telegram_id: int) -> FSMContext:
     return dp.fsm.get_context(bot=bot, chat_id=telegram_id, user_id=telegram_id)
 
-async def run_survey_dispatch(bot: Bot):
-    due = await get_due(_now_utc_iso())
-    for rec in due:
-        try:
-            ctx = await get_user_context(bot, rec["telegram_id"])
-            await send_survey_message(
-                bot=bot,
-                state=ctx,                    
-                user_id=rec["user_id"],
-                telegram_id=rec["telegram_id"],
-                booking_id=rec["booking_id"],
-                barber_id=rec["barber_id"],
-                lang=rec.get("lang", "🇺🇿 uz"),
-            )
-            await mark_sent(rec["booking_id"])
-        except Exception as e:
-            print(f"[survey] failed for booking {rec['booking_id']}: {e}")
+async def _fetch_many(fetch, keys) -> dict:
+    keys = list(dict.fromkeys(k for k in keys if k is not None))
+    results = await asyncio.gather(*(fetch(k) for k in keys), return_exceptions=True)
+    return {k: r for k, r in zip(keys, results) if r and not isinstance(r, Exception)}
 
+async def dispatch_surveys(bot: Bot, records: list[dict]) -> list[int]:
+    ## prefetch every booking, barber and service of the batch once, then send concurrently
+    bookings = await _fetch_many(db.get_booking_by_id, (rec["booking_id"] for rec in records))
+    barbers, services = await asyncio.gather(
+        _fetch_many(lambda barber_id: db.get_user_by_id(id=barber_id), (rec["barber_id"] for rec in records)),
+        _fetch_many(db.get_barber_service_by_id, (b.get("service_id") for b in bookings.values())),
+    )
+
+    sem = asyncio.Semaphore(SURVEY_CONCURRENCY)
+
+    async def send_one(rec: dict) -> int | None:
+        async with sem:
+            booking = bookings.get(rec["booking_id"])
+            try:
+                ctx = await get_user_context(bot, rec["telegram_id"])
+                await send_survey_message(
+                    bot=bot,
+                    state=ctx,
+                    user_id=rec["user_id"],
+                    telegram_id=rec["telegram_id"],
+                    booking_id=rec["booking_id"],
+                    barber_id=rec["barber_id"],
+                    lang=rec.get("lang", "🇺🇿 uz"),
+                    booking=booking or {},
+                    barber=barbers.get(rec["barber_id"], {}),
+                    service=services.get(booking.get("service_id"), {}) if booking else {},
+                )
+                return rec["booking_id"]
+            except Exception as e:
+                logger.error("[survey] failed for booking %s: %s", rec["booking_id"], e)
+                return None
+
+    results = await asyncio.gather(*(send_one(rec) for rec in records))
+    return [booking_id for booking_id in results if booking_id is not None]
+
+
+### ==== SURVEY TIMER ==== ###
+class SurveyTimer:
+    ## min-heap of (fire_at, booking_id); _records is the source of truth,
+    ## heap entries that no longer match it are skipped when popped
+    def __init__(self, bot: Bot, resync_interval: int = SURVEY_RESYNC_INTERVAL):
+        self.bot = bot
+        self.resync_interval = resync_interval
+        self._heap: list[tuple[float, int]] = []
+        self._records: dict[int, dict] = {}
+        self._due_at: dict[int, float] = {}
+        self._wake = asyncio.Event()
+        self._task: asyncio.Task | None = None
+        self._next_resync = 0.0
+        self.stats = {"sent": 0, "failed": 0, "max_lag": 0.0}
+        subscribe(self._on_change)
+
+    def _schedule(self, rec: dict, fire_at: float | None = None) -> None:
+        booking_id = rec["booking_id"]
+        fire_at = fire_at if fire_at is not None else _to_ts(rec["send_at"])
+        self._records[booking_id] = rec
+        self._due_at[booking_id] = fire_at
+        heapq.heappush(self._heap, (fire_at, booking_id))
+
+    def _on_change(self, event: str, payload) -> None:
+        if event == "add":
+            self._schedule(payload)
+        elif event == "remove":
+            self._records.pop(payload, None)
+            self._due_at.pop(payload, None)
+        self._wake.set()
+
+    async def load(self) -> None:
+        for rec in await get_pending():
+            ## keep the retry time of a record that already failed in this process
+            if rec["booking_id"] not in self._records:
+                self._schedule(rec)
+        self._next_resync = time.time() + self.resync_interval
+
+    def _pop_due(self, now: float) -> list[dict]:
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            fire_at, booking_id = heapq.heappop(self._heap)
+            if self._due_at.get(booking_id) != fire_at:
+                continue
+            del self._due_at[booking_id]
+            due.append(self._records.pop(booking_id))
+            self.stats["max_lag"] = max(self.stats["max_lag"], now - fire_at)
+        return due
+
+    async def _fire(self, records: list[dict]) -> None:
+        sent = await dispatch_surveys(self.bot, records)
+        await mark_sent_many(sent)
+        self.stats["sent"] += len(sent)
+        retry_at = time.time() + SURVEY_RETRY_DELAY
+        ok = set(sent)
+        for rec in records:
+            if rec["booking_id"] not in ok:
+                self.stats["failed"] += 1
+                self._schedule(rec, retry_at)
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                if time.time() >= self._next_resync:
+                    await self.load()
+                due = self._pop_due(time.time())
+                if due:
+                    await self._fire(due)
+            except Exception as e:
+                logger.exception("survey timer tick failed: %s", e)
+                self._next_resync = time.time() + self.resync_interval
+
+            now = time.time()
+            wait = self._next_resync - now
+            if self._heap:
+                wait = min(wait, self._heap[0][0] - now)
+            self._wake.clear()
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=max(wait, 0))
+            except asyncio.TimeoutError:
+                pass
+
+    async def start(self) -> None:
+        await self.load()
+        self._task = asyncio.create_task(self._run())
+        logger.info("survey timer: %s pending surveys loaded", len(self._records))
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def metrics(self) -> dict:
+        next_at = min(self._due_at.values(), default=None)
+        return {**self.stats, "pending": len(self._records), "next_in": round(next_at - time.time(), 1) if next_at else None}
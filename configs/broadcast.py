@@ -0,0 +1,369 @@
+import asyncio
+import contextlib
+import json
+import logging
+import os
+import time
+import uuid
+
+from aiogram import Bot
+from aiogram.exceptions import (
+    TelegramRetryAfter, TelegramForbiddenError, TelegramBadRequest, TelegramNetworkError, TelegramServerError,
+)
+from aiogram.types import FSInputFile, URLInputFile, InputMediaPhoto
+from decouple import config
+
+from configs import functions as cf
+from keyboards import inline as kb_i
+
+logger = logging.getLogger(__name__)
+
+JOBS_DIR = os.path.join(os.path.dirname(__file__), "data", "broadcasts")
+
+## Telegram allows ~30 messages/second in total for a bot; stay a little below it
+BROADCAST_RATE = config("BROADCAST_RATE", default=25, cast=float)
+BROADCAST_CONCURRENCY = config("BROADCAST_CONCURRENCY", default=20, cast=int)
+BROADCAST_PROGRESS_INTERVAL = config("BROADCAST_PROGRESS_INTERVAL", default=5, cast=float)
+BROADCAST_PAUSE = config("BROADCAST_PAUSE", default=30, cast=float)
+BROADCAST_MAX_RETRIES = 3
+## errors that say nothing about the recipient: retried, never counted as failed
+_TRANSIENT = (TelegramNetworkError, TelegramServerError)
+
+
+### ==== RATE LIMITER ==== ###
+class TokenBucket:
+    ## state is [tokens, updated, paused_until]; a shared multiprocessing array lets the
+    ## webhook workers and the front draw from one bucket, since the limit is per bot
+    def __init__(self, rate: float, capacity: float | None = None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self._state = [self.capacity, time.monotonic(), 0.0]
+        self._shared_lock = None
+        self._lock = asyncio.Lock()
+
+    def initial_state(self) -> list[float]:
+        return [self.capacity, time.monotonic(), 0.0]
+
+    def share(self, state) -> None:
+        ## state is a multiprocessing Array("d", 3) created by the worker pool
+        self._state = state
+        self._shared_lock = state.get_lock()
+
+    def _locked(self):
+        return self._shared_lock if self._shared_lock is not None else contextlib.nullcontext()
+
+    def pause(self, seconds: float) -> None:
+        ## flood control from Telegram applies to the whole bot, so every sender waits
+        with self._locked():
+            self._state[2] = max(self._state[2], time.monotonic() + seconds)
+            self._state[0] = 0
+
+    def _take(self, cost: float) -> float:
+        ## takes the tokens and returns 0, or returns how long to wait for them
+        with self._locked():
+            now = time.monotonic()
+            if now < self._state[2]:
+                return self._state[2] - now
+            tokens = min(self.capacity, self._state[0] + (now - self._state[1]) * self.rate)
+            self._state[1] = now
+            if tokens >= cost:
+                self._state[0] = tokens - cost
+                return 0
+            self._state[0] = tokens
+            return (cost - tokens) / self.rate
+
+    async def acquire(self, cost: int = 1) -> None:
+        cost = min(cost, self.capacity)
+        async with self._lock:
+            while True:
+                wait = self._take(cost)
+                if not wait:
+                    return
+                await asyncio.sleep(wait)
+
+
+telegram_limiter = TokenBucket(BROADCAST_RATE)
+
+
+async def send_limited(call, *args, cost: int = 1, **kwargs):
+    ## sends through the shared limiter, waiting out RetryAfter; other errors propagate
+    for attempt in range(BROADCAST_MAX_RETRIES + 1):
+        await telegram_limiter.acquire(cost)
+        try:
+            return await call(*args, **kwargs)
+        except TelegramRetryAfter as e:
+            telegram_limiter.pause(e.retry_after)
+            if attempt == BROADCAST_MAX_RETRIES:
+                raise
+            logger.warning("Flood control, retry after %ss", e.retry_after)
+
+
+### ==== JOBS ==== ###
+## a job is three files: <id>.json (settings), <id>.recipients (written once)
+## and <id>.progress (cursor and counters, rewritten after every window)
+_PROGRESS_KEYS = ("cursor", "success", "failed")
+
+
+def _job_path(job_id: str, kind: str = "json") -> str:
+    return os.path.join(JOBS_DIR, f"{job_id}.{kind}")
+
+
+def _write_json(path: str, data) -> None:
+    os.makedirs(JOBS_DIR, exist_ok=True)
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp, path)
+
+
+def _save_job(job: dict) -> None:
+    meta = {k: v for k, v in job.items() if k != "recipients" and k not in _PROGRESS_KEYS}
+    _write_json(_job_path(job["id"]), meta)
+
+
+def _save_recipients(job: dict) -> None:
+    _write_json(_job_path(job["id"], "recipients"), job["recipients"])
+
+
+def _save_progress(job: dict) -> None:
+    _write_json(_job_path(job["id"], "progress"), {k: job[k] for k in _PROGRESS_KEYS})
+
+
+def _remove_job(job_id: str) -> None:
+    for kind in ("json", "recipients", "progress"):
+        try:
+            os.remove(_job_path(job_id, kind))
+        except FileNotFoundError:
+            pass
+
+
+def _read_json(path: str, default=None):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return default
+
+
+def _load_jobs() -> list[dict]:
+    if not os.path.isdir(JOBS_DIR):
+        return []
+    jobs = []
+    for name in sorted(os.listdir(JOBS_DIR)):
+        if not name.endswith(".json"):
+            continue
+        try:
+            job = _read_json(os.path.join(JOBS_DIR, name))
+            if "recipients" in job:
+                ## job saved before the split: move recipients into their own file once
+                _save_recipients(job)
+            else:
+                job["recipients"] = _read_json(_job_path(job["id"], "recipients"))
+            job.update(_read_json(_job_path(job["id"], "progress"), {}))
+            job.setdefault("cursor", 0)
+            job.setdefault("success", 0)
+            job.setdefault("failed", 0)
+        except (OSError, json.JSONDecodeError, TypeError, KeyError) as e:
+            logger.error("Broken broadcast job %s: %s", name, e)
+            continue
+        if job["recipients"] is None:
+            logger.error("Broken broadcast job %s: recipients file missing", name)
+            continue
+        jobs.append(job)
+    return jobs
+
+
+def progress_bar(done: int, total: int, length: int = 20) -> str:
+    if total == 0:
+        return ""
+    filled = int(length * done / total)
+    return "█" * filled + "░" * (length - filled)
+
+
+_tasks: dict[str, asyncio.Task] = {}
+## process that runs the jobs it starts: "front", or the index of a webhook worker;
+## a restarted worker resumes the jobs it owned
+_owner: str | int = "front"
+
+
+def set_owner(owner: str | int) -> None:
+    global _owner
+    _owner = owner
+
+
+def _resumed_by(job: dict, owner: str | int, workers: int) -> bool:
+    job_owner = job.get("owner", "front")
+    if owner == "front":
+        ## jobs of workers that no longer exist (smaller pool, single process) fall back to the front
+        return job_owner == "front" or not (isinstance(job_owner, int) and job_owner < workers)
+    return job_owner == owner
+
+
+### ==== MEDIA ==== ###
+def _needs_upload(ref: str) -> bool:
+    return ref.startswith(("http://", "https://")) or os.path.isfile(ref)
+
+
+async def _upload_once(bot: Bot, job: dict) -> None:
+    ## a url or local file would be fetched/uploaded again for every recipient:
+    ## upload it once to the sender's chat and broadcast the returned file_id
+    changed = False
+    for index, ref in enumerate(job["media"]):
+        if not _needs_upload(ref):
+            continue
+        source = URLInputFile(ref) if ref.startswith(("http://", "https://")) else FSInputFile(ref)
+        msg = await send_limited(bot.send_photo, job["status_chat_id"], source, disable_notification=True)
+        job["media"][index] = msg.photo[-1].file_id
+        changed = True
+        try:
+            await bot.delete_message(job["status_chat_id"], msg.message_id)
+        except Exception:
+            pass
+    if changed:
+        _save_job(job)
+
+
+def album_media(media: list[str], caption: str | None) -> list[InputMediaPhoto]:
+    return [
+        InputMediaPhoto(media=ref, caption=caption if index == 0 else None, parse_mode="HTML")
+        for index, ref in enumerate(media)
+    ]
+
+
+async def _deliver(bot: Bot, job: dict, chat_id: int) -> None:
+    reply_markup = kb_i.post_button(job["buttons"]) if job["buttons"] else None
+    media = job["media"]
+    if len(media) > 1:
+        await send_limited(bot.send_media_group, chat_id, album_media(media, job["description"]), cost=len(media))
+        if reply_markup:
+            ## albums cannot carry an inline keyboard, the buttons follow in their own message
+            await send_limited(bot.send_message, chat_id, "⬇️", reply_markup=reply_markup)
+    elif media:
+        await send_limited(bot.send_photo, chat_id, media[0], caption=job["description"], reply_markup=reply_markup, parse_mode="HTML")
+    else:
+        await send_limited(bot.send_message, chat_id, job["description"], reply_markup=reply_markup, parse_mode="HTML")
+
+
+async def _send_post(bot: Bot, job: dict, chat_id: int) -> bool | None:
+    ## True sent, False undeliverable to this chat, None network/server errors outlived the retries
+    for attempt in range(BROADCAST_MAX_RETRIES + 1):
+        try:
+            await _deliver(bot, job, chat_id)
+            return True
+        except (TelegramForbiddenError, TelegramBadRequest) as e:
+            logger.info("Broadcast skip uid=%s: %s", chat_id, e)
+            return False
+        except _TRANSIENT as e:
+            if attempt == BROADCAST_MAX_RETRIES:
+                logger.warning("Broadcast uid=%s still failing: %s", chat_id, e)
+                return None
+            await asyncio.sleep(2 ** attempt)
+        except Exception as e:
+            logger.warning("Broadcast fail uid=%s: %s", chat_id, e)
+            return False
+
+
+async def _edit_status(bot: Bot, job: dict, text: str, parse_mode: str | None = None) -> None:
+    try:
+        await bot.edit_message_text(text, chat_id=job["status_chat_id"], message_id=job["status_message_id"], parse_mode=parse_mode)
+    except Exception as e:
+        logger.debug("Broadcast status edit failed: %s", e)
+
+
+async def _run_job(bot: Bot, job: dict) -> None:
+    recipients = job["recipients"]
+    total = len(recipients)
+    started = time.monotonic()
+    sent_at_start = job["cursor"]
+    last_progress = 0.0
+
+    try:
+        await _upload_once(bot, job)
+    except Exception as e:
+        logger.error("Broadcast %s media upload failed: %s", job["id"], e)
+
+    while job["cursor"] < total:
+        ## the cursor only moves past a window once every send in it finished,
+        ## so a crash repeats at most one window
+        window = recipients[job["cursor"]:job["cursor"] + BROADCAST_CONCURRENCY]
+        size = len(window)
+        while window:
+            results = await asyncio.gather(*(_send_post(bot, job, uid) for uid in window))
+            job["success"] += results.count(True)
+            job["failed"] += results.count(False)
+            ## Telegram or the network is down: pause the job and retry only those chats
+            window = [uid for uid, result in zip(window, results) if result is None]
+            if window:
+                logger.warning("Broadcast %s: %s sends hit network errors, pausing %ss", job["id"], len(window), BROADCAST_PAUSE)
+                await asyncio.sleep(BROADCAST_PAUSE)
+        job["cursor"] += size
+        _save_progress(job)
+
+        now = time.monotonic()
+        if now - last_progress >= BROADCAST_PROGRESS_INTERVAL and job["cursor"] < total:
+            last_progress = now
+            await _edit_status(bot, job, f"📊 Прогресс: {job['cursor']} / {total}\n[{progress_bar(job['cursor'], total)}]")
+
+    elapsed = max(time.monotonic() - started, 0.001)
+    rate = (job["cursor"] - sent_at_start) / elapsed
+    job["status"] = "done"
+    job["finished_at"] = time.time()
+    _save_job(job)
+    _save_progress(job)
+
+    datas = {"success": job["success"], "failed": job["failed"]}
+    text = cf.get_text(job["lang"], job["role"], "message", "post_sent_result").format(**datas)
+    await _edit_status(bot, job, f"{text}\n\n⏱ {elapsed:.0f}s · {rate:.1f} msg/s", parse_mode="HTML")
+    logger.info("Broadcast %s done: %s ok, %s failed, %.1f msg/s", job["id"], job["success"], job["failed"], rate)
+    _remove_job(job["id"])
+
+
+def _spawn(bot: Bot, job: dict) -> None:
+    task = asyncio.create_task(_run_job(bot, job))
+    _tasks[job["id"]] = task
+    task.add_done_callback(lambda t: _tasks.pop(job["id"], None))
+
+
+async def start_broadcast(bot: Bot, status_message, lang: str, role: str, recipients: list[int],
+                          description: str | None, photo: str | None = None, photos: list[str] | None = None,
+                          buttons: list | None = None) -> str:
+    job = {
+        "id": uuid.uuid4().hex,
+        "status": "running",
+        "lang": lang,
+        "role": role,
+        "description": description,
+        "media": list(photos or ([photo] if photo else [])),
+        "buttons": buttons or [],
+        "recipients": recipients,
+        "cursor": 0,
+        "success": 0,
+        "failed": 0,
+        "status_chat_id": status_message.chat.id,
+        "status_message_id": status_message.message_id,
+        "created_at": time.time(),
+        "owner": _owner,
+    }
+    await asyncio.to_thread(_save_recipients, job)
+    _save_progress(job)
+    _save_job(job)
+    _spawn(bot, job)
+    return job["id"]
+
+
+async def resume_broadcasts(bot: Bot, workers: int = 0) -> None:
+    ## workers: size of the webhook worker pool running next to this front process
+    for job in _load_jobs():
+        if "media" not in job:
+            photo = job.pop("photo", None)
+            job["media"] = [photo] if photo else []
+        if job.get("status") == "running" and job["id"] not in _tasks and _resumed_by(job, _owner, workers):
+            if job.get("owner", "front") != _owner:
+                job["owner"] = _owner
+                _save_job(job)
+            logger.info("Resuming broadcast %s at %s / %s", job["id"], job["cursor"], len(job["recipients"]))
+            _spawn(bot, job)
+
+
+def broadcast_stats() -> dict:
+    return {"running": len(_tasks), "rate": telegram_limiter.rate}
@@ -0,0 +1,333 @@
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from datetime import date, datetime, time as dtime
+from typing import Any, Dict, Mapping, Optional
+from urllib.parse import urlparse
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, StateType, StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+from decouple import config
+
+logger = logging.getLogger(__name__)
+
+FSM_STORAGE = config("FSM_STORAGE", default="sqlite").lower()
+FSM_SQLITE_PATH = config("FSM_SQLITE_PATH", default=os.path.join(os.path.dirname(__file__), "data", "fsm.db"))
+FSM_REDIS_URL = config("FSM_REDIS_URL", default="redis://127.0.0.1:6379/0")
+FSM_TTL = config("FSM_TTL", default=3 * 24 * 3600, cast=int)
+FSM_FLUSH_INTERVAL = config("FSM_FLUSH_INTERVAL", default=0.2, cast=float)
+
+
+### ==== SERIALIZER ==== ###
+## handlers keep dates, States and sets in FSM data, plain json cannot round-trip them
+def _encode(obj):
+    if isinstance(obj, State):
+        return obj.state
+    if isinstance(obj, datetime):
+        return {"__t": "datetime", "v": obj.isoformat()}
+    if isinstance(obj, date):
+        return {"__t": "date", "v": obj.isoformat()}
+    if isinstance(obj, dtime):
+        return {"__t": "time", "v": obj.isoformat()}
+    if isinstance(obj, (set, frozenset)):
+        return {"__t": "set", "v": list(obj)}
+    raise TypeError(f"FSM data value of type {type(obj).__name__} is not serializable")
+
+
+def _decode(obj: dict):
+    kind = obj.get("__t")
+    if kind is None or len(obj) != 2:
+        return obj
+    value = obj["v"]
+    if kind == "datetime":
+        return datetime.fromisoformat(value)
+    if kind == "date":
+        return date.fromisoformat(value)
+    if kind == "time":
+        return dtime.fromisoformat(value)
+    if kind == "set":
+        return set(value)
+    return obj
+
+
+def dumps(data: Mapping[str, Any]) -> str:
+    return json.dumps(dict(data), default=_encode, ensure_ascii=False, separators=(",", ":"))
+
+
+def loads(raw: Optional[str]) -> Dict[str, Any]:
+    if not raw:
+        return {}
+    return json.loads(raw, object_hook=_decode)
+
+
+def _state_name(state: StateType) -> Optional[str]:
+    return state.state if isinstance(state, State) else state
+
+
+### ==== WRITE-BEHIND BASE ==== ###
+## writes are collected in memory and flushed in one batch every `flush_interval` seconds;
+## reads see pending writes first, so this stays consistent while a user sticks to one process
+class BufferedStorage(BaseStorage):
+    def __init__(self, ttl: int = FSM_TTL, flush_interval: float = FSM_FLUSH_INTERVAL):
+        self.ttl = ttl
+        self.flush_interval = flush_interval
+        self.key_builder = DefaultKeyBuilder(with_bot_id=True, with_destiny=True)
+        self._pending: dict[str, dict[str, Any]] = {}
+        self._flusher: asyncio.Task | None = None
+        self._flush_lock = asyncio.Lock()
+        self.stats = {"writes": 0, "flushes": 0, "flushed_keys": 0}
+
+    ## backend hooks
+    async def _load(self, key: str) -> tuple[Optional[str], Optional[str]]:
+        raise NotImplementedError
+
+    async def _store(self, batch: dict[str, dict[str, Any]]) -> None:
+        raise NotImplementedError
+
+    async def _close_backend(self) -> None:
+        pass
+
+    def _buffer(self, key: StorageKey, field: str, value) -> None:
+        self._pending.setdefault(self.key_builder.build(key), {})[field] = value
+        self.stats["writes"] += 1
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.create_task(self._flush_later())
+
+    async def _flush_later(self) -> None:
+        await asyncio.sleep(self.flush_interval)
+        await self.flush()
+
+    async def flush(self) -> None:
+        async with self._flush_lock:
+            if not self._pending:
+                return
+            batch, self._pending = self._pending, {}
+            try:
+                await self._store(batch)
+            except Exception:
+                logger.exception("FSM storage flush failed, %s keys kept for retry", len(batch))
+                for key, fields in batch.items():
+                    self._pending[key] = {**fields, **self._pending.get(key, {})}
+                return
+            self.stats["flushes"] += 1
+            self.stats["flushed_keys"] += len(batch)
+
+    async def _read(self, key: StorageKey, field: str):
+        built = self.key_builder.build(key)
+        pending = self._pending.get(built)
+        if pending and field in pending:
+            return pending[field]
+        state, data = await self._load(built)
+        return state if field == "state" else data
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        self._buffer(key, "state", _state_name(state))
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        return await self._read(key, "state")
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        self._buffer(key, "data", dumps(data) if data else None)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        return loads(await self._read(key, "data"))
+
+    async def close(self) -> None:
+        if self._flusher and not self._flusher.done():
+            self._flusher.cancel()
+        await self.flush()
+        await self._close_backend()
+
+
+### ==== SQLITE ==== ###
+class SQLiteStorage(BufferedStorage):
+    def __init__(self, path: str = FSM_SQLITE_PATH, **kwargs):
+        super().__init__(**kwargs)
+        self.path = path
+        self._conn: sqlite3.Connection | None = None
+        self._conn_lock = threading.Lock()
+        self._last_purge = 0.0
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS fsm ("
+                "key TEXT PRIMARY KEY, state TEXT, data TEXT, updated_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS fsm_updated_at ON fsm(updated_at)")
+            self._conn = conn
+        return self._conn
+
+    def _load_sync(self, key: str):
+        with self._conn_lock:
+            row = self._connect().execute(
+                "SELECT state, data FROM fsm WHERE key = ? AND updated_at >= ?",
+                (key, time.time() - self.ttl),
+            ).fetchone()
+        return row or (None, None)
+
+    def _store_sync(self, batch: dict[str, dict[str, Any]]) -> None:
+        now = time.time()
+        states = [(key, f["state"], now) for key, f in batch.items() if "state" in f]
+        datas = [(key, f["data"], now) for key, f in batch.items() if "data" in f]
+        with self._conn_lock, self._connect() as conn:
+            conn.execute("BEGIN")
+            conn.executemany(
+                "INSERT INTO fsm(key, state, updated_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET state = excluded.state, updated_at = excluded.updated_at",
+                states,
+            )
+            conn.executemany(
+                "INSERT INTO fsm(key, data, updated_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at",
+                datas,
+            )
+            ## abandoned conversations
+            if now - self._last_purge > 600:
+                conn.execute("DELETE FROM fsm WHERE updated_at < ?", (now - self.ttl,))
+                self._last_purge = now
+
+    async def _load(self, key: str):
+        return await asyncio.to_thread(self._load_sync, key)
+
+    async def _store(self, batch):
+        await asyncio.to_thread(self._store_sync, batch)
+
+    async def _close_backend(self) -> None:
+        with self._conn_lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+### ==== REDIS ==== ###
+class RespError(Exception):
+    pass
+
+
+## minimal RESP2 client, enough for GET/SET/DEL pipelines against redis or any compatible server
+class RespClient:
+
+    def __init__(self, url: str):
+        parsed = urlparse(url)
+        self.host = parsed.hostname or "127.0.0.1"
+        self.port = parsed.port or 6379
+        self.password = parsed.password
+        self.db = int((parsed.path or "/0").lstrip("/") or 0)
+        self._reader: asyncio.StreamReader | None = None
+        self._writer: asyncio.StreamWriter | None = None
+        self._lock = asyncio.Lock()
+
+    @staticmethod
+    def _pack(*args) -> bytes:
+        out = [b"*%d\r\n" % len(args)]
+        for arg in args:
+            raw = arg if isinstance(arg, bytes) else str(arg).encode()
+            out.append(b"$%d\r\n%s\r\n" % (len(raw), raw))
+        return b"".join(out)
+
+    async def _read_reply(self):
+        line = await self._reader.readline()
+        if not line:
+            raise ConnectionError("redis connection closed")
+        kind, payload = line[:1], line[1:-2]
+        if kind == b"+":
+            return payload.decode()
+        if kind == b"-":
+            raise RespError(payload.decode())
+        if kind == b":":
+            return int(payload)
+        if kind == b"$":
+            size = int(payload)
+            if size < 0:
+                return None
+            raw = await self._reader.readexactly(size + 2)
+            return raw[:-2].decode()
+        if kind == b"*":
+            size = int(payload)
+            if size < 0:
+                return None
+            return [await self._read_reply() for _ in range(size)]
+        raise RespError(f"unexpected reply: {line!r}")
+
+    async def _connect(self) -> None:
+        self._reader, self._writer = await asyncio.open_connection(self.host, self.port)
+        setup = []
+        if self.password:
+            setup.append(("AUTH", self.password))
+        if self.db:
+            setup.append(("SELECT", self.db))
+        if setup:
+            await self._roundtrip(setup)
+
+    async def _roundtrip(self, commands):
+        self._writer.write(b"".join(self._pack(*cmd) for cmd in commands))
+        await self._writer.drain()
+        return [await self._read_reply() for _ in commands]
+
+    async def pipeline(self, commands: list[tuple]) -> list:
+        async with self._lock:
+            for attempt in (1, 2):
+                try:
+                    if self._writer is None or self._writer.is_closing():
+                        await self._connect()
+                    return await self._roundtrip(commands)
+                except (ConnectionError, OSError, asyncio.IncompleteReadError):
+                    await self.close()
+                    if attempt == 2:
+                        raise
+
+    async def execute(self, *args):
+        return (await self.pipeline([args]))[0]
+
+    async def close(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+            try:
+                await self._writer.wait_closed()
+            except Exception:
+                pass
+        self._reader = self._writer = None
+
+
+class RedisStorage(BufferedStorage):
+    def __init__(self, url: str = FSM_REDIS_URL, **kwargs):
+        super().__init__(**kwargs)
+        self.client = RespClient(url)
+
+    async def _load(self, key: str):
+        state, data = await self.client.pipeline([("GET", f"{key}:state"), ("GET", f"{key}:data")])
+        return state, data
+
+    async def _store(self, batch):
+        commands = []
+        for key, fields in batch.items():
+            for field, value in fields.items():
+                if value is None:
+                    commands.append(("DEL", f"{key}:{field}"))
+                else:
+                    commands.append(("SET", f"{key}:{field}", value, "EX", self.ttl))
+        await self.client.pipeline(commands)
+
+    async def _close_backend(self) -> None:
+        await self.client.close()
+
+
+def build_storage() -> BaseStorage:
+    if FSM_STORAGE == "redis":
+        logger.info("FSM storage: redis %s", FSM_REDIS_URL)
+        return RedisStorage()
+    if FSM_STORAGE == "memory":
+        logger.info("FSM storage: memory")
+        return MemoryStorage()
+    logger.info("FSM storage: sqlite %s", FSM_SQLITE_PATH)
+    return SQLiteStorage()
@@ -1,9 +1,14 @@
-import json, random, asyncio, logging, csv, io, pytz
+import json, asyncio, logging, csv, gzip, os, sys, tempfile, pytz
 
+from collections import deque
 from datetime import datetime, timedelta
 from pathlib import Path
-from aiogram.types import FSInputFile, BufferedInputFile
+from typing import TypedDict
+from aiogram.types import FSInputFile
 
+from middlewares.keyboard_swap import keyboard_swap
+
+from configs.json_file import file_lock, write_json
 from configs import functions as cf
 
 logger = logging.getLogger(__name__)
@@ -28,12 +33,6 @@ def get_role_menu_label(role_key: str) -> str:
 
 LOGO_PATH = Path("images/logo.png")
 
-def get_logo_file() -> FSInputFile | None:
-    if LOGO_PATH.exists():
-        return FSInputFile(LOGO_PATH)
-    print("❌ Не удалось найти изображение для отправки.")
-    return None
-
 def load_translations():
     try:
         with open("configs/data/datas.json", "r", encoding="utf-8") as file:
@@ -44,14 +43,83 @@ def load_translations():
 
 translations = load_translations()
 
+BUTTON_SECTIONS = ("button", "buttons")
+
+
+def _flatten(node: dict, prefix: tuple = ()):
+    for key, value in node.items():
+        path = prefix + (sys.intern(key),)
+        if isinstance(value, dict):
+            yield from _flatten(value, path)
+        elif isinstance(value, str):
+            yield path, sys.intern(value)
+
+
+def compile_translations(data: dict):
+    ## {lang: {path tuple: text}}, {lang: {role: {label: button id}}} and the paths some language lacks
+    catalog = {lang: dict(_flatten(node)) for lang, node in data.items() if isinstance(node, dict)}
+
+    labels = {}
+    for lang, table in catalog.items():
+        by_role = labels.setdefault(lang, {})
+        for path, text in table.items():
+            ## a label used by two buttons of one role keeps the first id
+            if len(path) == 3 and path[1] in BUTTON_SECTIONS:
+                by_role.setdefault(path[0], {}).setdefault(text, path[2])
+
+    all_paths = set().union(*catalog.values()) if catalog else set()
+    missing = {lang: sorted(all_paths - table.keys()) for lang, table in catalog.items()}
+    missing = {lang: paths for lang, paths in missing.items() if paths}
+    return catalog, labels, missing
+
+
+def _report_missing(missing: dict) -> None:
+    for lang, paths in missing.items():
+        logger.warning("translations: %s keys missing in %s: %s", len(paths), lang, ", ".join(".".join(p) for p in paths))
+
+
+_catalog, _labels, MISSING_KEYS = compile_translations(translations)
+_report_missing(MISSING_KEYS)
+## bumped by reload_translations(); memoized keyboards are rebuilt when it changes
+catalog_version = 0
+
 
 def get_text(lang: str, *path: str) -> str:
-    result = translations.get(lang, {})
-    for key in path:
-        result = result.get(key, {})
-    if isinstance(result, str):
-        return result
-    return f"[{lang}." + ".".join(path) + "]"
+    text = _catalog.get(lang, {}).get(path)
+    if text is not None:
+        return text
+    return f"[{lang}." + ".".join(map(str, path)) + "]"
+
+
+def button_id(lang: str, role: str, text: str) -> str | None:
+    ## reverse lookup of a reply button label: "⬅️ Orqaga" -> "back"
+    return _labels.get(lang, {}).get(role, {}).get(text)
+
+
+def _build_actions(labels: dict) -> dict[str, dict[str, str]]:
+    ## label text in any language -> {role: button id}
+    actions = {}
+    for by_role in labels.values():
+        for role_key, table in by_role.items():
+            for text, bid in table.items():
+                actions.setdefault(text, {}).setdefault(role_key, bid)
+    return actions
+
+
+_actions = _build_actions(_labels)
+
+
+def reload_translations() -> None:
+    global translations, _catalog, _labels, MISSING_KEYS, _actions, catalog_version
+    translations = load_translations()
+    _catalog, _labels, MISSING_KEYS = compile_translations(translations)
+    _actions = _build_actions(_labels)
+    _report_missing(MISSING_KEYS)
+    catalog_version += 1
+
+
+def button_actions(text: str | None) -> dict[str, str]:
+    return _actions.get(text, {}) if text else {}
 
 
 UZ_DAYS = ["Dushanba", "Seshanba", "Chorshanba", "Payshanba", "Juma", "Shanba", "Yakshanba"]
@@ -81,39 +149,81 @@ def get_days_from_today(lang):
 
 BUTTONS_PATH = Path("configs/data/buttons.json")
 
+
+class AdminButtonStore:
+    ## buttons.json kept in memory: {telegram_id: {"buttons": [...]}}; re-read only
+    ## when the file's mtime changes, written through atomically. Edits re-read the
+    ## file under a file lock so an edit made by another process is never overwritten
+    def __init__(self, path: Path):
+        self.path = path
+        self._data: dict[str, dict] = {}
+        self._sets: dict[str, frozenset[str]] = {}
+        self._mtime: int | None = None
+
+    def _load(self, force: bool = False) -> None:
+        try:
+            mtime = self.path.stat().st_mtime_ns
+        except FileNotFoundError:
+            mtime = 0
+        if mtime == self._mtime and not force:
+            return
+        try:
+            data = json.loads(self.path.read_text(encoding="utf-8")) if mtime else {}
+        except json.JSONDecodeError as e:
+            logger.error(f"Error reading buttons from {self.path}: {e}")
+            data = {}
+        self._data = data
+        self._sets = {tid: frozenset((v or {}).get("buttons", [])) for tid, v in data.items()}
+        self._mtime = mtime
+
+    def _save(self) -> None:
+        write_json(self.path, self._data, indent=2)
+        self._mtime = self.path.stat().st_mtime_ns
+
+    def get(self, telegram_id) -> list[str]:
+        self._load()
+        return list((self._data.get(str(telegram_id)) or {}).get("buttons", []))
+
+    def has(self, telegram_id, button_id: str) -> bool:
+        self._load()
+        return button_id in self._sets.get(str(telegram_id), ())
+
+    def set(self, telegram_id, buttons: list[str]) -> None:
+        with file_lock(self.path):
+            self._load(force=True)
+            self._data[str(telegram_id)] = {"buttons": list(buttons)}
+            self._sets[str(telegram_id)] = frozenset(buttons)
+            self._save()
+
+    def delete(self, telegram_id) -> bool:
+        with file_lock(self.path):
+            self._load(force=True)
+            if self._data.pop(str(telegram_id), None) is None:
+                return False
+            self._sets.pop(str(telegram_id), None)
+            self._save()
+            return True
+
+
+admin_buttons = AdminButtonStore(BUTTONS_PATH)
+
+
 def get_admin_buttons(telegram_id: int):
-    try:
-        data = json.loads(BUTTONS_PATH.read_text(encoding="utf-8"))
-    except (json.JSONDecodeError, FileNotFoundError) as e:
-        logger.error(f"Error reading buttons from {BUTTONS_PATH}: {e}")
-        return []
-    return (data.get(str(telegram_id)) or {}).get("buttons", [])
+    return admin_buttons.get(telegram_id)
+
+def has_admin_button(telegram_id: int, button_id: str) -> bool:
+    return admin_buttons.has(telegram_id, button_id)
 
 def set_admin_buttons(telegram_id: int, buttons: list[str]) -> None:
     try:
-        if BUTTONS_PATH.exists():
-            data = json.loads(BUTTONS_PATH.read_text(encoding="utf-8"))
-        else:
-            data = {}
-        
-        data[str(telegram_id)] = {"buttons": buttons}
-
-        BUTTONS_PATH.write_text(json.dumps(data, ensure_ascii=False, indent=2), encoding="utf-8")
+        admin_buttons.set(telegram_id, buttons)
         logger.info(f"Updated buttons for admin {telegram_id}")
     except Exception as e:
         logger.error(f"Error saving buttons for admin {telegram_id}: {e}")
 
 async def delete_admin_from_json(admin_id: str):
     try:
-        if BUTTONS_PATH.exists():
-            data = json.loads(BUTTONS_PATH.read_text(encoding="utf-8"))
-        else:
-            data = {}
-        
-        if str(admin_id) in data:
-            del data[str(admin_id)]  
-
-            BUTTONS_PATH.write_text(json.dumps(data, ensure_ascii=False, indent=2), encoding="utf-8")
+        if admin_buttons.delete(admin_id):
             logger.info(f"Admin with ID {admin_id} was deleted successfully.")
             return True
         else:
@@ -143,9 +253,8 @@ SECRET_MESSAGES = [
 ]
 
 async def get_random_modes(message, user_id, ReplyKeyboardRemove):
-    msg = await message.bot.send_message(user_id, random.choice(SECRET_MESSAGES), reply_markup=ReplyKeyboardRemove())
-    await asyncio.sleep(0.025)
-    await msg.delete()
+    ## the reply keyboard is removed together with the next message sent to the user
+    keyboard_swap.remove_keyboard(user_id)
 
 AVAILABLE_BUTTONS = [
     "notifications",
@@ -160,50 +269,152 @@ def button_title(lang: str, role: str, button_id: str) -> str:
     return cf.get_text(lang, role, "button", button_id)
 
 
-def generate_clients_csv(clients: list[dict]) -> BufferedInputFile:
-    output = io.StringIO()
-    writer = csv.writer(output)
-    writer.writerow(["Ismi/Имя", "Telefon/Телефон", "Til/Язык", "Bronlar soni/Количество бронов", "Status/Статус"])
-
-    for c in clients:
-        status = "⛔️" if 5 in c.get("roles") else "✅"
-        writer.writerow([
-            c.get("first_name") or "❌",
-            c.get("phone_number") or "❌",
-            "🇺🇿" if c.get("language") == "uz" else "🇷🇺",
-            c.get("total_booking", 0),
-            status
-        ])
+CLIENTS_CSV_HEADER = ["Ismi/Имя", "Telefon/Телефон", "Til/Язык", "Bronlar soni/Количество бронов", "Status/Статус"]
 
-    output.seek(0)
-    csv_file = io.BytesIO(output.getvalue().encode("utf-8"))
-    csv_file.name = "clients.csv"
-    return BufferedInputFile(csv_file.getvalue(), filename="clients.csv")
 
+def _client_row(c: dict) -> list:
+    status = "⛔️" if 5 in (c.get("roles") or []) else "✅"
+    return [
+        c.get("first_name") or "❌",
+        c.get("phone_number") or "❌",
+        "🇺🇿" if c.get("language") == "uz" else "🇷🇺",
+        c.get("total_bookings", c.get("total_booking", 0)),
+        status
+    ]
 
-def get_info_project() -> dict:
-    try:
-        with open("configs/data/project_infos.json", "r", encoding="utf-8") as file:
-            return json.load(file)
-    except (FileNotFoundError, json.JSONDecodeError) as e:
-        logger.error(f"Error loading project information: {e}")
-        return {}
 
-def update_infos(payload: dict) -> None:
+def _open_export(fmt: str, path: str):
+    ## returns (write_rows, close) for the chosen format
+    if fmt == "xlsx":
+        try:
+            from openpyxl import Workbook
+        except ImportError:
+            logger.warning("openpyxl is not installed, exporting clients as csv")
+        else:
+            wb = Workbook(write_only=True)
+            ws = wb.create_sheet("clients")
+            ws.append(CLIENTS_CSV_HEADER)
+
+            def write_rows(rows):
+                for row in rows:
+                    ws.append(row)
+            return write_rows, lambda: wb.save(path), "xlsx"
+
+    if fmt == "csv.gz":
+        f = gzip.open(path, "wt", encoding="utf-8", newline="")
+    else:
+        fmt = "csv"
+        f = open(path, "w", encoding="utf-8", newline="")
+    writer = csv.writer(f)
+    writer.writerow(CLIENTS_CSV_HEADER)
+    return writer.writerows, f.close, fmt
+
+
+async def export_clients(pages, fmt: str = "csv", keep_last: int = 5) -> tuple[FSInputFile | None, str | None, list[dict]]:
+    ## rows are written page by page to a temp file, so memory stays flat whatever the client count;
+    ## the caller sends the file and removes it with os.remove(path)
+    fd, path = tempfile.mkstemp(prefix="clients_", suffix=".export")
+    os.close(fd)
+    last = deque(maxlen=keep_last)
+    count = 0
     try:
-        with open("configs/data/project_infos.json", "r+", encoding="utf-8") as file:
-            data = json.load(file)
-
+        write_rows, close, fmt = _open_export(fmt, path)
+        try:
+            async for page in pages:
+                await asyncio.to_thread(write_rows, [_client_row(c) for c in page])
+                last.extend(page)
+                count += len(page)
+        finally:
+            await asyncio.to_thread(close)
+    except BaseException:
+        ## a failed (or cancelled) export must not leave a half-written file in the temp dir
+        os.remove(path)
+        raise
+
+    if not count:
+        os.remove(path)
+        return None, None, []
+    return FSInputFile(path, filename=f"clients.{fmt}"), path, list(last)
+
+
+class ProjectContact(TypedDict, total=False):
+    barber_shop: str
+    contact: str
+
+
+class ProjectLocation(TypedDict, total=False):
+    latitude: float
+    longitude: float
+    address: str
+
+
+class ProjectPriceList(TypedDict, total=False):
+    message: str
+
+
+class ProjectInfo(TypedDict, total=False):
+    project_contact: ProjectContact
+    project_location: ProjectLocation
+    project_price_list: ProjectPriceList
+
+
+PROJECT_INFOS_PATH = Path("configs/data/project_infos.json")
+
+
+class ProjectInfoStore:
+    ## project_infos.json served from memory. Writes build a new snapshot and swap it in
+    ## (readers keep a consistent one); mtime catches other processes' writes.
+    ## update() re-reads the file under a file lock, so concurrent editors never drop each other's changes
+    def __init__(self, path: Path):
+        self.path = path
+        self._data: ProjectInfo = {}
+        self._mtime: int | None = None
+
+    def _load(self, force: bool = False) -> None:
+        try:
+            mtime = self.path.stat().st_mtime_ns
+        except FileNotFoundError as e:
+            if self._mtime is None:
+                logger.error(f"Error loading project information: {e}")
+            self._mtime = 0
+            return
+        if mtime == self._mtime and not force:
+            return
+        try:
+            self._data = json.loads(self.path.read_text(encoding="utf-8"))
+        except json.JSONDecodeError as e:
+            logger.error(f"Error loading project information: {e}")
+        self._mtime = mtime
+
+    def get(self) -> ProjectInfo:
+        ## the returned snapshot is shared, do not modify it
+        self._load()
+        return self._data
+
+    def update(self, payload: dict) -> None:
+        with file_lock(self.path):
+            self._load(force=True)
+            data = {key: dict(value) if isinstance(value, dict) else value for key, value in self._data.items()}
             for key, value in payload.items():
                 if isinstance(value, dict) and isinstance(data.get(key), dict):
                     data[key].update(value)
                 else:
                     data[key] = value
 
-            file.seek(0)
-            json.dump(data, file, ensure_ascii=False, indent=2)
-            file.truncate()
+            write_json(self.path, data, indent=2)
+            self._data = data
+            self._mtime = self.path.stat().st_mtime_ns
 
-    except (FileNotFoundError, json.JSONDecodeError) as e:
+
+project_infos = ProjectInfoStore(PROJECT_INFOS_PATH)
+
+
+def get_info_project() -> ProjectInfo:
+    return project_infos.get()
+
+def update_infos(payload: dict) -> None:
+    try:
+        project_infos.update(payload)
+    except OSError as e:
         logger.error(f"Error updating project information: {e}")
 
@@ -0,0 +1,39 @@
+import logging
+from typing import Callable
+
+logger = logging.getLogger(__name__)
+
+## every bot process (the webhook front and each worker) keeps its own in-memory caches;
+## an invalidation published in one process is applied locally and replayed in all the others
+_handlers: dict[str, Callable] = {}
+_sink: Callable[[str, tuple], None] | None = None
+
+
+def register(kind: str, fn: Callable) -> None:
+    _handlers[kind] = fn
+
+
+def attach(sink: Callable[[str, tuple], None] | None) -> None:
+    ## set by the worker pool; without one (single process) invalidations stay local
+    global _sink
+    _sink = sink
+
+
+def apply(kind: str, args: tuple) -> None:
+    fn = _handlers.get(kind)
+    if fn is None:
+        logger.warning("unknown invalidation %s", kind)
+        return
+    try:
+        fn(*args)
+    except Exception as e:
+        logger.error("invalidation %s%s failed: %s", kind, args, e)
+
+
+def publish(kind: str, *args) -> None:
+    apply(kind, args)
+    if _sink is not None:
+        try:
+            _sink(kind, args)
+        except Exception as e:
+            logger.error("invalidation %s not forwarded: %s", kind, e)
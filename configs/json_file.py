@@ -0,0 +1,49 @@
+import contextlib
+import json
+import os
+import tempfile
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:  ## windows: single-process setups only
+    fcntl = None
+
+
+@contextlib.contextmanager
+def file_lock(path: Path):
+    ## exclusive lock on <path>.lock held across a read-modify-write,
+    ## so writers in other processes (webhook workers) cannot lose each other's edits
+    if fcntl is None:
+        yield
+        return
+    with open(f"{path}.lock", "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def read_json(path: Path, default=None):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return default
+
+
+def write_json(path: Path, data, **dump_kwargs) -> None:
+    ## a unique temp file per write, renamed over the target once complete
+    fd, tmp = tempfile.mkstemp(dir=Path(path).parent, prefix=f".{Path(path).name}.", suffix=".tmp")
+    try:
+        if hasattr(os, "fchmod"):
+            ## mkstemp creates 0600, keep the usual mode of the data files
+            os.fchmod(fd, 0o644)
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, **dump_kwargs)
+        os.replace(tmp, path)
+    except BaseException:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(tmp)
+        raise
@@ -0,0 +1,104 @@
+import json
+import logging
+import os
+from pathlib import Path
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import FSInputFile, Message
+
+from configs.json_file import file_lock, read_json, write_json
+
+logger = logging.getLogger(__name__)
+
+REGISTRY_PATH = os.path.join(os.path.dirname(__file__), "data", "media_ids.json")
+
+## {bot_id: {asset path: {"file_id": ..., "mtime": ..., "size": ...}}}
+_registry: dict[str, dict[str, dict]] = {}
+_registry_mtime: int | None = None
+
+
+def _read() -> dict:
+    try:
+        return read_json(REGISTRY_PATH, {})
+    except (OSError, json.JSONDecodeError):
+        return {}
+
+
+def _load() -> dict:
+    ## re-read when another worker process has written the file
+    global _registry, _registry_mtime
+    try:
+        mtime = os.stat(REGISTRY_PATH).st_mtime_ns
+    except FileNotFoundError:
+        mtime = 0
+    if mtime != _registry_mtime:
+        _registry = _read() if mtime else {}
+        _registry_mtime = mtime
+    return _registry
+
+
+def _update(fn) -> None:
+    ## locked re-read, change, write: entries saved by other processes are kept
+    global _registry, _registry_mtime
+    with file_lock(REGISTRY_PATH):
+        data = _read()
+        if not fn(data):
+            return
+        write_json(REGISTRY_PATH, data, indent=2)
+        _registry = data
+        _registry_mtime = os.stat(REGISTRY_PATH).st_mtime_ns
+
+
+def _fingerprint(path: Path) -> dict:
+    stat = path.stat()
+    return {"mtime": stat.st_mtime, "size": stat.st_size}
+
+
+def get_file_id(bot: Bot, path: Path) -> str | None:
+    entry = _load().get(str(bot.id), {}).get(str(path))
+    if entry and entry.get("mtime") == path.stat().st_mtime and entry.get("size") == path.stat().st_size:
+        return entry["file_id"]
+    return None
+
+
+def remember(bot: Bot, path: Path, file_id: str) -> None:
+    entry = {"file_id": file_id, **_fingerprint(path)}
+
+    def apply(data: dict) -> bool:
+        data.setdefault(str(bot.id), {})[str(path)] = entry
+        return True
+    _update(apply)
+
+
+def forget(bot: Bot, path: Path) -> None:
+    _update(lambda data: data.get(str(bot.id), {}).pop(str(path), None) is not None)
+
+
+async def send_static_photo(bot: Bot, chat_id: int, path: Path, **kwargs) -> Message | None:
+    ## the first send uploads the file, later sends reuse Telegram's file_id
+    path = Path(path)
+    if not path.exists():
+        logger.error("❌ Не удалось найти изображение для отправки: %s", path)
+        return None
+
+    file_id = get_file_id(bot, path)
+    if file_id:
+        try:
+            return await bot.send_photo(chat_id=chat_id, photo=file_id, **kwargs)
+        except TelegramBadRequest as e:
+            ## stale or foreign file_id: drop it and upload again
+            logger.warning("file_id for %s rejected (%s), re-uploading", path, e)
+            try:
+                forget(bot, path)
+            except OSError as e:
+                logger.error("media registry: could not drop %s: %s", path, e)
+
+    msg = await bot.send_photo(chat_id=chat_id, photo=FSInputFile(path), **kwargs)
+    if msg.photo:
+        ## the photo is already sent: a failed save only costs another upload next time
+        try:
+            remember(bot, path, msg.photo[-1].file_id)
+        except OSError as e:
+            logger.error("media registry: could not save file_id for %s: %s", path, e)
+    return msg
@@ -1,61 +1,270 @@
-import asyncio, json
+import asyncio, json, logging, sqlite3, threading
 from pathlib import Path
-from datetime import datetime, timezone
+from datetime import datetime, timezone, timedelta
+
+from decouple import config
+
+from configs.json_file import file_lock, read_json, write_json
+
+logger = logging.getLogger(__name__)
 
 SURVEY_FILE = Path("configs/data/surveys.json")
+SURVEY_DB = Path(config("SURVEY_DB_PATH", default="configs/data/surveys.db"))
+SURVEY_STORAGE = config("SURVEY_STORAGE", default="sqlite").lower()
+SURVEY_RETENTION_DAYS = config("SURVEY_RETENTION_DAYS", default=7, cast=int)
 SURVEY_FILE.parent.mkdir(parents=True, exist_ok=True)
-_LOCK = asyncio.Lock()
+
+FIELDS = ("booking_id", "user_id", "telegram_id", "barber_id", "lang", "send_at", "sent", "created_at", "sent_at")
+
 
 def _now_utc_iso() -> str:
     return datetime.now(timezone.utc).isoformat(timespec="seconds").replace("+00:00", "Z")
 
-async def _read() -> dict:
-    if not SURVEY_FILE.exists():
-        return {}
-    with SURVEY_FILE.open("r", encoding="utf-8") as f:
-        return json.load(f)
 
-async def _write(data: dict) -> None:
-    tmp = SURVEY_FILE.with_suffix(".json.tmp")
-    with tmp.open("w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
-    tmp.replace(SURVEY_FILE)
+def _retention_cutoff() -> str:
+    cutoff = datetime.now(timezone.utc) - timedelta(days=SURVEY_RETENTION_DAYS)
+    return cutoff.isoformat(timespec="seconds").replace("+00:00", "Z")
+
+
+### ==== SQLITE BACKEND ==== ###
+class SQLiteSurveyBackend:
+    def __init__(self, path: Path = SURVEY_DB):
+        self.path = path
+        self._conn: sqlite3.Connection | None = None
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS surveys ("
+                "booking_id INTEGER PRIMARY KEY, user_id INTEGER, telegram_id INTEGER, barber_id INTEGER, "
+                "lang TEXT, send_at TEXT NOT NULL, sent INTEGER NOT NULL DEFAULT 0, created_at TEXT, sent_at TEXT)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS surveys_due ON surveys(sent, send_at)")
+            self._conn = conn
+            self._migrate_json(conn)
+        return self._conn
+
+    def _migrate_json(self, conn: sqlite3.Connection) -> None:
+        ## one-shot import of the old surveys.json; the file is renamed so it never runs twice
+        if not SURVEY_FILE.exists():
+            return
+        try:
+            with SURVEY_FILE.open("r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            logger.error("survey json migration skipped: %s", e)
+            return
+        if not data:
+            return
+        rows = [tuple(int(rec.get(k) or 0) if k == "sent" else rec.get(k) for k in FIELDS) for rec in data.values()]
+        with conn:
+            conn.execute("BEGIN")
+            conn.executemany(
+                f"INSERT OR IGNORE INTO surveys({', '.join(FIELDS)}) VALUES ({', '.join('?' * len(FIELDS))})",
+                rows,
+            )
+        SURVEY_FILE.replace(SURVEY_FILE.with_suffix(".json.migrated"))
+        logger.info("migrated %s surveys from %s", len(rows), SURVEY_FILE)
+
+    def _run(self, fn, *args):
+        with self._lock:
+            return fn(self._connect(), *args)
+
+    @staticmethod
+    def _add(conn, rec: dict) -> None:
+        conn.execute(
+            f"INSERT OR REPLACE INTO surveys({', '.join(FIELDS)}) VALUES ({', '.join('?' * len(FIELDS))})",
+            tuple(rec.get(k) for k in FIELDS),
+        )
+
+    @staticmethod
+    def _due(conn, now_iso: str, limit: int | None) -> list[dict]:
+        sql = "SELECT * FROM surveys WHERE sent = 0 AND send_at <= ? ORDER BY send_at"
+        params = [now_iso]
+        if limit:
+            sql += " LIMIT ?"
+            params.append(limit)
+        return [dict(row) for row in conn.execute(sql, params)]
+
+    @staticmethod
+    def _pending(conn) -> list[dict]:
+        return [dict(row) for row in conn.execute("SELECT * FROM surveys WHERE sent = 0 ORDER BY send_at")]
+
+    @staticmethod
+    def _mark_sent_many(conn, booking_ids: list[int], sent_at: str) -> None:
+        with conn:
+            conn.execute("BEGIN")
+            conn.executemany(
+                "UPDATE surveys SET sent = 1, sent_at = ? WHERE booking_id = ?",
+                [(sent_at, booking_id) for booking_id in booking_ids],
+            )
+
+    @staticmethod
+    def _remove(conn, booking_id: int) -> None:
+        conn.execute("DELETE FROM surveys WHERE booking_id = ?", (booking_id,))
+
+    @staticmethod
+    def _compact(conn, before_iso: str) -> int:
+        return conn.execute("DELETE FROM surveys WHERE sent = 1 AND sent_at < ?", (before_iso,)).rowcount
+
+    async def add(self, rec: dict) -> None:
+        await asyncio.to_thread(self._run, self._add, rec)
+
+    async def due(self, now_iso: str, limit: int | None = None) -> list[dict]:
+        return await asyncio.to_thread(self._run, self._due, now_iso, limit)
+
+    async def pending(self) -> list[dict]:
+        return await asyncio.to_thread(self._run, self._pending)
+
+    async def mark_sent_many(self, booking_ids: list[int], sent_at: str) -> None:
+        await asyncio.to_thread(self._run, self._mark_sent_many, booking_ids, sent_at)
+
+    async def remove(self, booking_id: int) -> None:
+        await asyncio.to_thread(self._run, self._remove, booking_id)
+
+    async def compact(self, before_iso: str) -> int:
+        return await asyncio.to_thread(self._run, self._compact, before_iso)
+
+
+### ==== JSON BACKEND (legacy) ==== ###
+class JsonSurveyBackend:
+    ## every change re-reads the file under a file lock and writes it back through a unique
+    ## temp file, so webhook workers adding surveys at the same time keep each other's records
+    def __init__(self, path: Path = SURVEY_FILE):
+        self.path = path
+        self._data: dict = {}
+        self._mtime: int | None = None
+
+    def _read(self) -> dict:
+        try:
+            return read_json(self.path, {})
+        except json.JSONDecodeError as e:
+            logger.error("survey file unreadable: %s", e)
+            return {}
+
+    def _load(self) -> dict:
+        try:
+            mtime = self.path.stat().st_mtime_ns
+        except FileNotFoundError:
+            mtime = 0
+        if mtime != self._mtime:
+            self._data = self._read() if mtime else {}
+            self._mtime = mtime
+        return self._data
+
+    def _locked_update(self, fn):
+        with file_lock(self.path):
+            data = self._read()
+            result, changed = fn(data)
+            if changed:
+                write_json(self.path, data, separators=(",", ":"))
+                self._mtime = self.path.stat().st_mtime_ns
+            self._data = data
+            return result
+
+    async def _update(self, fn):
+        return await asyncio.to_thread(self._locked_update, fn)
+
+    async def add(self, rec: dict) -> None:
+        def apply(data):
+            data[str(rec["booking_id"])] = rec
+            return None, True
+        await self._update(apply)
+
+    async def due(self, now_iso: str, limit: int | None = None) -> list[dict]:
+        out = sorted(
+            (rec for rec in self._load().values() if not rec.get("sent") and rec.get("send_at") <= now_iso),
+            key=lambda rec: rec["send_at"],
+        )
+        return out[:limit] if limit else out
+
+    async def pending(self) -> list[dict]:
+        return sorted((rec for rec in self._load().values() if not rec.get("sent")), key=lambda rec: rec["send_at"])
+
+    async def mark_sent_many(self, booking_ids: list[int], sent_at: str) -> None:
+        def apply(data):
+            for booking_id in booking_ids:
+                rec = data.get(str(booking_id))
+                if rec:
+                    rec["sent"] = True
+                    rec["sent_at"] = sent_at
+            return None, True
+        await self._update(apply)
+
+    async def remove(self, booking_id: int) -> None:
+        def apply(data):
+            return None, data.pop(str(booking_id), None) is not None
+        await self._update(apply)
+
+    async def compact(self, before_iso: str) -> int:
+        def apply(data):
+            old = [k for k, rec in data.items() if rec.get("sent") and (rec.get("sent_at") or "") < before_iso]
+            for k in old:
+                del data[k]
+            return len(old), bool(old)
+        return await self._update(apply)
+
+
+_backend = JsonSurveyBackend() if SURVEY_STORAGE == "json" else SQLiteSurveyBackend()
+_LOCK = asyncio.Lock()
+
+## in-process subscribers (the survey timer) called as fn("add", record) / fn("remove", booking_id)
+_listeners: list = []
+
+
+def subscribe(fn) -> None:
+    _listeners.append(fn)
+
+
+def _notify(event: str, payload) -> None:
+    for fn in _listeners:
+        try:
+            fn(event, payload)
+        except Exception as e:
+            logger.error("survey listener failed: %s", e)
+
 
 async def add_pending(booking_id: int, user_id: int, telegram_id: int, barber_id: int, send_at_iso_utc: str, lang: str = "🇺🇿 uz") -> None:
+    rec = {
+        "booking_id": booking_id,
+        "user_id": user_id,
+        "telegram_id": telegram_id,
+        "barber_id": barber_id,
+        "lang": lang,
+        "send_at": send_at_iso_utc,
+        "sent": False,
+        "created_at": _now_utc_iso(),
+    }
     async with _LOCK:
-        data = await _read()
-        data[str(booking_id)] = {
-            "booking_id": booking_id,
-            "user_id": user_id,
-            "telegram_id": telegram_id,
-            "barber_id": barber_id,
-            "lang": lang,
-            "send_at": send_at_iso_utc,
-            "sent": False,
-            "created_at": _now_utc_iso(),
-        }
-        await _write(data)
-
-async def get_due(now_iso_utc: str) -> list[dict]:
+        await _backend.add(rec)
+    _notify("add", rec)
+
+async def get_due(now_iso_utc: str, limit: int | None = None) -> list[dict]:
     async with _LOCK:
-        data = await _read()
-        out = []
-        for rec in data.values():
-            if not rec.get("sent") and rec.get("send_at") <= now_iso_utc:
-                out.append(rec)
-        return out
+        return await _backend.due(now_iso_utc, limit)
 
-async def mark_sent(booking_id: int) -> None:
+async def get_pending() -> list[dict]:
+    async with _LOCK:
+        return await _backend.pending()
+
+async def mark_sent_many(booking_ids: list[int]) -> None:
+    if not booking_ids:
+        return
     async with _LOCK:
-        data = await _read()
-        key = str(booking_id)
-        if key in data:
-            data[key]["sent"] = True
-            data[key]["sent_at"] = _now_utc_iso()
-            await _write(data)
+        await _backend.mark_sent_many(list(booking_ids), _now_utc_iso())
+        removed = await _backend.compact(_retention_cutoff())
+    if removed:
+        logger.info("survey storage: %s old sent records removed", removed)
+
+async def mark_sent(booking_id: int) -> None:
+    await mark_sent_many([booking_id])
 
 async def remove(booking_id: int) -> None:
     async with _LOCK:
-        data = await _read()
-        data.pop(str(booking_id), None)
-        await _write(data)
+        await _backend.remove(booking_id)
+    _notify("remove", booking_id)
@@ -0,0 +1,108 @@
+import logging
+import os
+import struct
+import time
+from collections import OrderedDict
+
+from decouple import config
+
+logger = logging.getLogger(__name__)
+
+DEDUP_PATH = config("UPDATE_DEDUP_PATH", default=os.path.join(os.path.dirname(__file__), "data", "seen_updates.bin"))
+DEDUP_WINDOW = config("UPDATE_DEDUP_WINDOW", default=24 * 3600, cast=int)
+DEDUP_CAPACITY = config("UPDATE_DEDUP_CAPACITY", default=50000, cast=int)
+
+## one slot per update: (update_id, seen_at unix time); an all-zero slot is empty
+_SLOT = struct.Struct("<qd")
+
+
+class UpdateDeduplicator:
+    def __init__(self, path: str = DEDUP_PATH, window: int = DEDUP_WINDOW, capacity: int = DEDUP_CAPACITY):
+        self.path = path
+        self.window = window
+        self.capacity = capacity
+        self._seen: OrderedDict[int, float] = OrderedDict()
+        self._cursor = 0
+        ## slot of every id still on disk and the id in every slot, so forget() clears exactly its own slot
+        self._slots: dict[int, int] = {}
+        self._owners: list[int | None] = [None] * capacity
+        self._fd: int | None = None
+        self.stats = {"checked": 0, "duplicates": 0}
+
+    def open(self) -> None:
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        size = self.capacity * _SLOT.size
+        if os.fstat(self._fd).st_size != size:
+            ## capacity changed or new file: start from an empty ring
+            os.ftruncate(self._fd, 0)
+            os.ftruncate(self._fd, size)
+            return
+
+        raw = os.pread(self._fd, size, 0)
+        cutoff = time.time() - self.window
+        slots = []
+        for index, (update_id, seen_at) in enumerate(_SLOT.iter_unpack(raw)):
+            if seen_at:
+                slots.append((seen_at, index, update_id))
+        slots.sort()
+        for seen_at, index, update_id in slots:
+            self._slots[update_id] = index
+            self._owners[index] = update_id
+            if seen_at >= cutoff:
+                self._seen[update_id] = seen_at
+        if slots:
+            self._cursor = (slots[-1][1] + 1) % self.capacity
+        logger.info("update dedup: %s recent update ids restored", len(self._seen))
+
+    def _persist(self, update_id: int, seen_at: float) -> None:
+        if self._fd is None:
+            return
+        slot = self._cursor
+        previous = self._owners[slot]
+        if previous is not None and self._slots.get(previous) == slot:
+            del self._slots[previous]
+        os.pwrite(self._fd, _SLOT.pack(update_id, seen_at), slot * _SLOT.size)
+        self._owners[slot] = update_id
+        self._slots[update_id] = slot
+        self._cursor = (slot + 1) % self.capacity
+
+    def _clear(self, update_id: int) -> None:
+        slot = self._slots.pop(update_id, None)
+        if slot is None or self._fd is None:
+            return
+        os.pwrite(self._fd, _SLOT.pack(0, 0), slot * _SLOT.size)
+        self._owners[slot] = None
+
+    def _expire(self, now: float) -> None:
+        cutoff = now - self.window
+        while self._seen:
+            update_id, seen_at = next(iter(self._seen.items()))
+            if seen_at >= cutoff and len(self._seen) <= self.capacity:
+                break
+            self._seen.popitem(last=False)
+
+    def is_duplicate(self, update_id: int) -> bool:
+        ## marks the id as seen; a redelivery of it returns True until it leaves the window
+        self.stats["checked"] += 1
+        if update_id in self._seen:
+            self.stats["duplicates"] += 1
+            return True
+        now = time.time()
+        self._seen[update_id] = now
+        self._persist(update_id, now)
+        self._expire(now)
+        return False
+
+    def forget(self, update_id: int) -> None:
+        ## the update was not accepted (e.g. queue full), Telegram's redelivery must go through
+        if self._seen.pop(update_id, None) is not None:
+            self._clear(update_id)
+
+    def metrics(self) -> dict:
+        return {**self.stats, "tracked": len(self._seen), "capacity": self.capacity, "window": self.window}
+
+    def close(self) -> None:
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
@@ -0,0 +1,116 @@
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable
+
+from aiogram.types import Update
+from decouple import config
+
+logger = logging.getLogger(__name__)
+
+WEBHOOK_ASYNC = config("WEBHOOK_ASYNC", default=False, cast=bool)
+UPDATE_QUEUE_CONSUMERS = config("UPDATE_QUEUE_CONSUMERS", default=16, cast=int)
+UPDATE_QUEUE_SIZE = config("UPDATE_QUEUE_SIZE", default=200, cast=int)
+UPDATE_QUEUE_PUT_TIMEOUT = config("UPDATE_QUEUE_PUT_TIMEOUT", default=5, cast=float)
+
+
+async def feed_and_report(bot, dp, update: Update, where: str = "webhook") -> None:
+    try:
+        await dp.feed_update(bot, update)
+    except Exception as e:
+        logger.exception("Ошибка обработки апдейта: %s", e)
+        try:
+            await bot.send_message(
+                chat_id="@logginggs",
+                text=f"Ошибка в {where}:\n\n<b>{e}</b>",
+                parse_mode="HTML"
+            )
+        except Exception:
+            pass
+        raise
+
+
+def chat_key(update: Update) -> int:
+    ## updates of one chat always land in the same shard, so they are handled in arrival order
+    try:
+        event = update.event
+    except Exception:
+        return update.update_id
+    chat = getattr(event, "chat", None) or getattr(getattr(event, "message", None), "chat", None)
+    if chat is not None:
+        return chat.id
+    sender = getattr(event, "from_user", None)
+    if sender is not None:
+        return sender.id
+    return update.update_id
+
+
+class UpdateQueue:
+    def __init__(
+        self,
+        process: Callable[[Update], Awaitable[None]],
+        consumers: int = UPDATE_QUEUE_CONSUMERS,
+        size: int = UPDATE_QUEUE_SIZE,
+    ):
+        self.process = process
+        self.consumers = consumers
+        self.size = size
+        self._shards: list[asyncio.Queue] = []
+        self._tasks: list[asyncio.Task] = []
+        self.stats = {"enqueued": 0, "processed": 0, "errors": 0, "rejected": 0, "total_ms": 0.0, "max_ms": 0.0, "max_wait_ms": 0.0}
+
+    def start(self) -> None:
+        ## per-shard bound, so one busy chat cannot take the whole capacity
+        shard_size = max(1, self.size // self.consumers)
+        self._shards = [asyncio.Queue(maxsize=shard_size) for _ in range(self.consumers)]
+        self._tasks = [asyncio.create_task(self._consume(q)) for q in self._shards]
+        logger.info("update queue started: %s consumers, %s slots each", self.consumers, shard_size)
+
+    async def put(self, update: Update, timeout: float = UPDATE_QUEUE_PUT_TIMEOUT) -> bool:
+        shard = self._shards[chat_key(update) % self.consumers]
+        try:
+            await asyncio.wait_for(shard.put((time.monotonic(), update)), timeout=timeout)
+        except asyncio.TimeoutError:
+            self.stats["rejected"] += 1
+            return False
+        self.stats["enqueued"] += 1
+        return True
+
+    async def _consume(self, shard: asyncio.Queue) -> None:
+        while True:
+            queued_at, update = await shard.get()
+            started = time.monotonic()
+            try:
+                await self.process(update)
+            except Exception:
+                ## already logged and reported by the process callback
+                self.stats["errors"] += 1
+            finally:
+                done = time.monotonic()
+                ms = (done - queued_at) * 1000
+                self.stats["processed"] += 1
+                self.stats["total_ms"] += ms
+                self.stats["max_ms"] = max(self.stats["max_ms"], ms)
+                self.stats["max_wait_ms"] = max(self.stats["max_wait_ms"], (started - queued_at) * 1000)
+                shard.task_done()
+
+    def depth(self) -> int:
+        return sum(q.qsize() for q in self._shards)
+
+    def metrics(self) -> dict:
+        processed = self.stats["processed"]
+        return {
+            **self.stats,
+            "depth": self.depth(),
+            "capacity": sum(q.maxsize for q in self._shards),
+            "avg_ms": round(self.stats["total_ms"] / processed, 2) if processed else 0.0,
+        }
+
+    async def stop(self, timeout: float = 10) -> None:
+        try:
+            await asyncio.wait_for(asyncio.gather(*(q.join() for q in self._shards)), timeout=timeout)
+        except asyncio.TimeoutError:
+            logger.warning("update queue stopped with %s updates left", self.depth())
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
@@ -0,0 +1,242 @@
+import asyncio
+import logging
+import multiprocessing as mp
+import os
+import queue
+import time
+
+from decouple import config
+
+logger = logging.getLogger(__name__)
+
+WEBHOOK_WORKERS = config("WEBHOOK_WORKERS", default=1, cast=int)
+WORKER_QUEUE_SIZE = config("WORKER_QUEUE_SIZE", default=1000, cast=int)
+HEARTBEAT_INTERVAL = 2.0
+HEARTBEAT_STALE = 10.0
+
+_USER_KEYS = (
+    "message", "edited_message", "callback_query", "inline_query",
+    "chosen_inline_result", "pre_checkout_query", "shipping_query", "my_chat_member", "chat_member",
+)
+
+
+def route_key(update: dict) -> int:
+    ## same user -> same worker, so per-user update order and FSM write-behind stay consistent
+    for name in _USER_KEYS:
+        event = update.get(name)
+        if not event:
+            continue
+        sender = event.get("from") or {}
+        if sender.get("id"):
+            return int(sender["id"])
+        chat = event.get("chat") or {}
+        if chat.get("id"):
+            return int(chat["id"])
+    return int(update.get("update_id") or 0)
+
+
+### ==== WORKER PROCESS ==== ###
+def _worker_main(index: int, updates: mp.Queue, control_in: mp.Queue, control_out: mp.Queue,
+                 limiter_state, heartbeats, processed) -> None:
+    logging.basicConfig(
+        level=logging.INFO,
+        format=f"%(asctime)s - worker-{index} - %(name)s - %(levelname)s - %(message)s",
+    )
+    try:
+        asyncio.run(_worker_loop(index, updates, control_in, control_out, limiter_state, heartbeats, processed))
+    except KeyboardInterrupt:
+        pass
+
+
+async def _worker_loop(index: int, updates: mp.Queue, control_in: mp.Queue, control_out: mp.Queue,
+                       limiter_state, heartbeats, processed) -> None:
+    from aiogram.types import Update
+    from handlers.register_handlers import bot, dp, ban_mw
+    from databases.database import close_session
+    from configs.update_queue import UpdateQueue, feed_and_report
+    from configs.broadcast import telegram_limiter, set_owner, resume_broadcasts
+    from configs import invalidation
+
+    loop = asyncio.get_running_loop()
+
+    ## cache invalidations go to the front, which replays them in every other process
+    invalidation.attach(lambda kind, args: control_out.put_nowait((index, kind, args)))
+    telegram_limiter.share(limiter_state)
+
+    async def listen():
+        while True:
+            item = await loop.run_in_executor(None, control_in.get)
+            if item is None:
+                break
+            invalidation.apply(*item)
+
+    async def beat():
+        while True:
+            heartbeats[index] = time.time()
+            await asyncio.sleep(HEARTBEAT_INTERVAL)
+
+    async def process(update: Update):
+        try:
+            await feed_and_report(bot, dp, update, where=f"worker-{index}")
+        finally:
+            processed[index] += 1
+
+    ## updates of different users run concurrently, one user's updates stay in order
+    update_queue = UpdateQueue(process)
+    update_queue.start()
+    beater = asyncio.create_task(beat())
+    listener = asyncio.create_task(listen())
+    ## broadcasts started here run here; after a crash the restarted worker picks them up
+    set_owner(index)
+    await resume_broadcasts(bot)
+    logger.info("worker %s started, pid %s", index, os.getpid())
+    try:
+        while True:
+            item = await loop.run_in_executor(None, updates.get)
+            if item is None:
+                break
+            try:
+                update = Update.model_validate(item)
+            except Exception as e:
+                logger.warning("Некорректный апдейт: %s", e)
+                continue
+            await update_queue.put(update, timeout=None)
+    finally:
+        beater.cancel()
+        listener.cancel()
+        await update_queue.stop()
+        await ban_mw.close()
+        await dp.storage.close()
+        await close_session()
+        await bot.session.close()
+        logger.info("worker %s stopped", index)
+
+
+### ==== POOL (front process) ==== ###
+class WorkerPool:
+    def __init__(self, size: int = WEBHOOK_WORKERS, queue_size: int = WORKER_QUEUE_SIZE):
+        self.size = size
+        self.queue_size = queue_size
+        self._ctx = mp.get_context("spawn")
+        self.heartbeats = self._ctx.Array("d", size, lock=False)
+        self.processed = self._ctx.Array("q", size, lock=False)
+        self.queues = [self._ctx.Queue(maxsize=queue_size) for _ in range(size)]
+        ## invalidations: workers -> front on one queue, front -> each worker on its own
+        self.control_out = self._ctx.Queue()
+        self.control_in = [self._ctx.Queue() for _ in range(size)]
+        ## the Telegram rate limit is per bot, so all processes draw from one shared bucket
+        from configs.broadcast import telegram_limiter
+        self.limiter = telegram_limiter
+        self.limiter_state = self._ctx.Array("d", telegram_limiter.initial_state())
+        self._relay: asyncio.Task | None = None
+        self.processes: list = [None] * size
+        self.restarts = 0
+        self._monitor: asyncio.Task | None = None
+
+    def _spawn(self, index: int) -> None:
+        ## not ready until the worker has imported the handlers and sent its first heartbeat
+        self.heartbeats[index] = 0
+        proc = self._ctx.Process(
+            target=_worker_main,
+            args=(index, self.queues[index], self.control_in[index], self.control_out,
+                  self.limiter_state, self.heartbeats, self.processed),
+            name=f"bot-worker-{index}",
+            daemon=True,
+        )
+        proc.start()
+        self.processes[index] = proc
+
+    async def start(self) -> None:
+        from configs.fsm_storage import FSM_STORAGE
+        if FSM_STORAGE == "memory":
+            logger.warning("FSM_STORAGE=memory with %s workers: survey states set by the front process will not reach workers", self.size)
+        from configs import invalidation
+        self.limiter.share(self.limiter_state)
+        invalidation.attach(lambda kind, args: self._forward(kind, args))
+        self._relay = asyncio.create_task(self._relay_loop())
+        for index in range(self.size):
+            self._spawn(index)
+        self._monitor = asyncio.create_task(self._watch())
+        logger.info("started %s webhook workers", self.size)
+
+    async def _watch(self) -> None:
+        while True:
+            await asyncio.sleep(HEARTBEAT_INTERVAL * 2)
+            for index, proc in enumerate(self.processes):
+                if proc is not None and not proc.is_alive():
+                    logger.error("worker %s exited with %s, restarting", index, proc.exitcode)
+                    self.restarts += 1
+                    self._spawn(index)
+
+    def _forward(self, kind: str, args: tuple, source: int = -1) -> None:
+        ## a restarted worker reads its queue from the start, so nothing is lost while it is down
+        for index, q in enumerate(self.control_in):
+            if index != source:
+                q.put_nowait((kind, args))
+
+    async def _relay_loop(self) -> None:
+        from configs import invalidation
+        loop = asyncio.get_running_loop()
+        while True:
+            item = await loop.run_in_executor(None, self.control_out.get)
+            if item is None:
+                break
+            source, kind, args = item
+            invalidation.apply(kind, args)
+            self._forward(kind, args, source)
+
+    def submit(self, update: dict) -> bool:
+        index = route_key(update) % self.size
+        try:
+            self.queues[index].put_nowait(update)
+        except queue.Full:
+            return False
+        return True
+
+    def status(self) -> list[dict]:
+        now = time.time()
+        result = []
+        for index, proc in enumerate(self.processes):
+            age = now - self.heartbeats[index]
+            alive = proc is not None and proc.is_alive()
+            try:
+                depth = self.queues[index].qsize()
+            except NotImplementedError:
+                depth = None
+            result.append({
+                "index": index,
+                "pid": proc.pid if proc else None,
+                "alive": alive,
+                "ready": alive and age < HEARTBEAT_STALE,
+                "heartbeat_age": round(age, 2),
+                "processed": self.processed[index],
+                "queue_depth": depth,
+            })
+        return result
+
+    def ready(self) -> bool:
+        return all(w["ready"] for w in self.status())
+
+    async def stop(self, timeout: float = 15) -> None:
+        from configs import invalidation
+        if self._monitor:
+            self._monitor.cancel()
+        invalidation.attach(None)
+        for q in self.queues:
+            try:
+                q.put(None, timeout=1)
+            except queue.Full:
+                pass
+        for q in self.control_in:
+            q.put_nowait(None)
+        loop = asyncio.get_running_loop()
+        for proc in self.processes:
+            if proc is None:
+                continue
+            await loop.run_in_executor(None, proc.join, timeout)
+            if proc.is_alive():
+                proc.terminate()
+        self.control_out.put_nowait(None)
+        if self._relay:
+            await self._relay
+        logger.info("webhook workers stopped")
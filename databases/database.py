@@ -1,18 +1,215 @@
-import aiohttp, asyncio, logging
+import aiohttp, asyncio, logging, copy, time, re
+from collections import OrderedDict
 from decouple import config
 
+from configs import invalidation
+
 logger = logging.getLogger(__name__)
 
 BASE_URL = config("BASE_URL")
 
 session: aiohttp.ClientSession | None = None
 
+
+### ==== CACHE ==== ###
+class TTLCache:
+    def __init__(self, max_size: int = 512):
+        self.max_size = max_size
+        self._items: OrderedDict[tuple, tuple[float, object]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        ## bumped on every invalidation of a namespace; a fetch that overlapped one must not be cached
+        self._generations: dict[str, int] = {}
+
+    def generation(self, namespace: str) -> int:
+        return self._generations.get(namespace, 0)
+
+    def get(self, key: tuple):
+        item = self._items.get(key)
+        if item is None:
+            self.misses += 1
+            return None
+        expires, value = item
+        if expires < time.monotonic():
+            del self._items[key]
+            self.misses += 1
+            return None
+        self._items.move_to_end(key)
+        self.hits += 1
+        return copy.deepcopy(value)
+
+    def set(self, key: tuple, value, ttl: float) -> None:
+        self._items[key] = (time.monotonic() + ttl, copy.deepcopy(value))
+        self._items.move_to_end(key)
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, namespace: str, key=None) -> None:
+        self._generations[namespace] = self.generation(namespace) + 1
+        if key is not None:
+            self._items.pop((namespace, str(key)), None)
+            return
+        for k in [k for k in self._items if k[0] == namespace]:
+            del self._items[k]
+
+    def clear(self) -> None:
+        self._items.clear()
+
+    def stats(self) -> dict:
+        return {"size": len(self._items), "hits": self.hits, "misses": self.misses, "evictions": self.evictions}
+
+
+CACHE_TTLS = {
+    "barbers": config("CACHE_TTL_BARBERS", default=60, cast=int),
+    "types_and_services": config("CACHE_TTL_TYPES", default=120, cast=int),
+    "types": config("CACHE_TTL_TYPES", default=120, cast=int),
+    "type": config("CACHE_TTL_TYPES", default=120, cast=int),
+    "services": config("CACHE_TTL_SERVICES", default=120, cast=int),
+    "service": config("CACHE_TTL_SERVICES", default=120, cast=int),
+    ## only booking hydration reads users through the cache, so a short ttl is enough
+    "user": config("CACHE_TTL_USERS", default=30, cast=int),
+}
+
+cache = TTLCache(max_size=config("CACHE_MAX_SIZE", default=512, cast=int))
+
+
+async def cached_get(namespace: str, key, endpoint: str):
+    cache_key = (namespace, str(key))
+    body = cache.get(cache_key)
+    if body is not None:
+        return body
+    generation = cache.generation(namespace)
+    body = await api_request("GET", endpoint)
+    if body is not None and cache.generation(namespace) == generation:
+        cache.set(cache_key, body, CACHE_TTLS[namespace])
+    return body
+
+
+def _invalidate_catalog(type_id=None, service_id=None) -> None:
+    cache.invalidate("types_and_services")
+    cache.invalidate("types")
+    if type_id is not None:
+        cache.invalidate("type", type_id)
+        cache.invalidate("services", type_id)
+    else:
+        cache.invalidate("type")
+        cache.invalidate("services")
+    if service_id is not None:
+        cache.invalidate("service", service_id)
+
+
+def _invalidate_barbers() -> None:
+    cache.invalidate("barbers")
+
+
+def _invalidate_user(user_id) -> None:
+    cache.invalidate("user", user_id)
+
+
+invalidation.register("catalog", _invalidate_catalog)
+invalidation.register("barbers", _invalidate_barbers)
+invalidation.register("user", _invalidate_user)
+
+
+## public helpers publish, so webhook workers drop the entry too
+def invalidate_catalog(type_id=None, service_id=None) -> None:
+    invalidation.publish("catalog", type_id, service_id)
+
+
+def invalidate_barbers() -> None:
+    invalidation.publish("barbers")
+
+
+def invalidate_user(user_id) -> None:
+    invalidation.publish("user", user_id)
+
+
+def invalidate_profile(telegram_id) -> None:
+    ## the ban middleware caches each user's roles and language by telegram id
+    if telegram_id:
+        invalidation.publish("ban", int(telegram_id))
+
+
+### ==== CONNECTION POOL ==== ###
+POOL_LIMIT = config("HTTP_POOL_LIMIT", default=100, cast=int)
+POOL_LIMIT_PER_HOST = config("HTTP_POOL_LIMIT_PER_HOST", default=30, cast=int)
+POOL_KEEPALIVE = config("HTTP_KEEPALIVE_TIMEOUT", default=30, cast=float)
+POOL_DNS_TTL = config("HTTP_DNS_CACHE_TTL", default=300, cast=int)
+POOL_WARMUP = config("HTTP_POOL_WARMUP", default=4, cast=int)
+
+pool_stats = {"in_flight": 0, "waiting": 0, "created": 0, "reused": 0, "max_in_flight": 0, "max_waiting": 0}
+
+
+async def _on_request_start(_session, _ctx, _params):
+    pool_stats["in_flight"] += 1
+    pool_stats["max_in_flight"] = max(pool_stats["max_in_flight"], pool_stats["in_flight"])
+
+async def _on_request_done(_session, _ctx, _params):
+    pool_stats["in_flight"] -= 1
+
+async def _on_queued_start(_session, _ctx, _params):
+    pool_stats["waiting"] += 1
+    pool_stats["max_waiting"] = max(pool_stats["max_waiting"], pool_stats["waiting"])
+
+async def _on_queued_end(_session, _ctx, _params):
+    pool_stats["waiting"] -= 1
+
+async def _on_connection_created(_session, _ctx, _params):
+    pool_stats["created"] += 1
+
+async def _on_connection_reused(_session, _ctx, _params):
+    pool_stats["reused"] += 1
+
+
+def _trace_config() -> aiohttp.TraceConfig:
+    trace = aiohttp.TraceConfig()
+    trace.on_request_start.append(_on_request_start)
+    trace.on_request_end.append(_on_request_done)
+    trace.on_request_exception.append(_on_request_done)
+    trace.on_connection_queued_start.append(_on_queued_start)
+    trace.on_connection_queued_end.append(_on_queued_end)
+    trace.on_connection_create_end.append(_on_connection_created)
+    trace.on_connection_reuseconn.append(_on_connection_reused)
+    return trace
+
+
+def get_pool_stats() -> dict:
+    return {**pool_stats, "limit": POOL_LIMIT, "limit_per_host": POOL_LIMIT_PER_HOST}
+
+
 async def get_session() -> aiohttp.ClientSession:
     global session
     if session is None or session.closed:
-        session = aiohttp.ClientSession()
+        connector = aiohttp.TCPConnector(
+            limit=POOL_LIMIT,
+            limit_per_host=POOL_LIMIT_PER_HOST,
+            keepalive_timeout=POOL_KEEPALIVE,
+            ttl_dns_cache=POOL_DNS_TTL,
+            use_dns_cache=True,
+        )
+        session = aiohttp.ClientSession(connector=connector, trace_configs=[_trace_config()])
     return session
 
+
+async def warm_up_pool(size: int = POOL_WARMUP):
+    ## open `size` keep-alive connections to BASE_URL before the first real traffic
+    if size <= 0:
+        return
+    sess = await get_session()
+    timeout = aiohttp.ClientTimeout(total=5)
+
+    async def _touch():
+        try:
+            async with sess.head(BASE_URL, timeout=timeout) as resp:
+                await resp.read()
+        except Exception as e:
+            logger.debug(f"[API] warm-up failed: {e}")
+
+    await asyncio.gather(*(_touch() for _ in range(size)))
+    logger.info(f"[API] connection pool warmed: {get_pool_stats()}")
+
 async def close_session():
     global session
     if session and not session.closed:
@@ -20,18 +217,94 @@ async def close_session():
         session = None
 
 
-async def api_request(method: str, endpoint: str, json=None, params=None, timeout: float = 10):
+### ==== SINGLE-FLIGHT ==== ###
+_inflight: dict[tuple, list] = {}
+api_stats = {"requests": 0, "coalesced": 0}
+endpoint_stats: dict[str, dict] = {}
+_ID_RE = re.compile(r"/\d+(?=/|$)")
+
+
+def _record_endpoint(method: str, endpoint: str, elapsed: float, ok: bool) -> None:
+    key = f"{method.upper()} {_ID_RE.sub('/{id}', endpoint)}"
+    stat = endpoint_stats.get(key)
+    if stat is None:
+        stat = endpoint_stats[key] = {"count": 0, "errors": 0, "total_ms": 0.0, "max_ms": 0.0}
+    ms = elapsed * 1000
+    stat["count"] += 1
+    stat["total_ms"] += ms
+    stat["max_ms"] = max(stat["max_ms"], ms)
+    if not ok:
+        stat["errors"] += 1
+
+
+def get_api_stats() -> dict:
+    endpoints = {
+        key: {**stat, "avg_ms": round(stat["total_ms"] / stat["count"], 2)}
+        for key, stat in endpoint_stats.items()
+    }
+    return {**api_stats, "inflight": len(_inflight), "cache": cache.stats(), "pool": get_pool_stats(), "endpoints": endpoints}
+
+
+async def api_request(method: str, endpoint: str, json=None, params=None, timeout: float = 10, data=None):
+    if method.upper() != "GET" or json is not None or data is not None:
+        result = await _send_request(method, endpoint, json=json, params=params, timeout=timeout, data=data)
+        ## reads already in flight may predate this write, later readers must not join them
+        _inflight.clear()
+        return result
+
+    key = (endpoint, tuple(sorted((params or {}).items())))
+    flight = _inflight.get(key)
+    if flight is not None:
+        api_stats["coalesced"] += 1
+        flight[1] += 1
+        try:
+            return copy.deepcopy(await asyncio.shield(flight[0]))
+        except asyncio.CancelledError:
+            if not flight[0].cancelled():
+                raise
+            ## leader was cancelled, do the request ourselves
+            return await _send_request(method, endpoint, params=params, timeout=timeout)
+
+    flight = [asyncio.get_running_loop().create_future(), 0]
+    _inflight[key] = flight
+    try:
+        body = await _send_request(method, endpoint, params=params, timeout=timeout)
+    except BaseException:
+        flight[0].cancel()
+        raise
+    else:
+        flight[0].set_result(body)
+    finally:
+        if _inflight.get(key) is flight:
+            del _inflight[key]
+    if flight[1] and body is not None:
+        return copy.deepcopy(body)
+    return body
+
+
+async def _send_request(method: str, endpoint: str, json=None, params=None, timeout: float = 10, data=None):
+    api_stats["requests"] += 1
+    started = time.monotonic()
+    ok = False
+    try:
+        body, ok = await _do_request(method, endpoint, json=json, params=params, timeout=timeout, data=data)
+        return body
+    finally:
+        _record_endpoint(method, endpoint, time.monotonic() - started, ok)
+
+
+async def _do_request(method: str, endpoint: str, json=None, params=None, timeout: float = 10, data=None):
     url = f"{BASE_URL}{endpoint}"
     sess = await get_session()
     req_timeout = aiohttp.ClientTimeout(total=timeout)
 
     try:
-        async with sess.request(method, url, json=json, params=params, timeout=req_timeout) as resp:
+        async with sess.request(method, url, json=json, data=data, params=params, timeout=req_timeout) as resp:
             status = resp.status
 
             if status == 204:
                 logger.info(f"[API] {method} {url} | {status} No Content")
-                return None
+                return None, True
 
             content_type = resp.headers.get("Content-Type", "")
             body = None
@@ -45,28 +318,25 @@ async def api_request(method: str, endpoint: str, json=None, params=None, timeou
 
             if 200 <= status < 300:
                 logger.info(f"[API] {method} {resp.url} | {status}")
-                if json:
-                    logger.info(f"Payload: {json}")
+                if json or data:
+                    logger.info(f"Payload: {json or data}")
                 if params:
                     logger.info(f"Params: {params}")
                 logger.info(f"Response: {body}")
-                return body
+                return body, True
 
             logger.error(f"[API] {method} {url} | HTTP error: {status} | Body: {body}")
-            return None
+            return None, False
 
     except asyncio.TimeoutError:
         logger.error(f"[API] {method} {url} | Timeout after {timeout}s")
-        return None
     except aiohttp.ClientResponseError as e:
         logger.error(f"[API] {method} {url} | ClientResponseError: {e.status} {e.message}")
-        return None
     except aiohttp.ClientError as e:
         logger.error(f"[API] {method} {url} | ClientError: {e}")
-        return None
     except Exception as e:
         logger.error(f"[API] {method} {url} | Unexpected error: {e}")
-        return None
+    return None, False
 
 
 ### ==== USERS ==== ###
@@ -100,6 +370,104 @@ async def get_users_all():
     return data_base
 
 
+### ==== PHONE INDEX ==== ###
+def normalize_phone(phone) -> str:
+    return "".join(ch for ch in str(phone or "") if ch.isdigit())
+
+
+def _language_label(code) -> str:
+    code = (code or "").lower()
+    return "🇺🇿 uz" if code.endswith("uz") else "🇷🇺 ru"
+
+
+class PhoneIndex:
+    def __init__(self, endpoint: str, ttl: float, min_refresh: float, require_telegram_id: bool = False):
+        self.endpoint = endpoint
+        self.ttl = ttl
+        self.min_refresh = min_refresh
+        self.require_telegram_id = require_telegram_id
+        self._items: dict[str, dict] = {}
+        self._loaded_at = 0.0
+        self._tried_at = 0.0
+        self._lock = asyncio.Lock()
+
+    def _accepts(self, user: dict) -> bool:
+        return bool(user.get("phone_number")) and (not self.require_telegram_id or bool(user.get("telegram_id")))
+
+    async def refresh(self, force: bool = False) -> None:
+        async with self._lock:
+            now = time.monotonic()
+            if now - self._tried_at < self.min_refresh or (not force and now - self._loaded_at < self.ttl):
+                return
+            self._tried_at = now
+            users = await api_request("GET", self.endpoint)
+            if not isinstance(users, list):
+                return
+            self._items = {normalize_phone(u.get("phone_number")): u for u in users if self._accepts(u)}
+            self._loaded_at = time.monotonic()
+
+    async def get(self, phone) -> dict | None:
+        key = normalize_phone(phone)
+        if not key:
+            return None
+        await self.refresh()
+        user = self._items.get(key)
+        if user is None:
+            ## unknown phone: maybe registered after the last load
+            await self.refresh(force=True)
+            user = self._items.get(key)
+        return copy.deepcopy(user) if user is not None else None
+
+    def put(self, user: dict) -> None:
+        if self._loaded_at and self._accepts(user):
+            self._items[normalize_phone(user.get("phone_number"))] = copy.deepcopy(user)
+
+    def telegram_id(self, phone=None, user_id=None):
+        ## best-effort lookup for cache invalidation, never hits the backend
+        if phone is not None:
+            return (self._items.get(normalize_phone(phone)) or {}).get("telegram_id")
+        for user in self._items.values():
+            if user.get("id") == user_id:
+                return user.get("telegram_id")
+        return None
+
+    def set_role(self, phone, role_id: int, present: bool) -> None:
+        user = self._items.get(normalize_phone(phone))
+        if user is None:
+            return
+        roles = [r for r in user.get("roles") or [] if r != role_id]
+        if present:
+            roles.append(role_id)
+        user["roles"] = roles
+
+
+PHONE_INDEX_TTL = config("PHONE_INDEX_TTL", default=600, cast=int)
+PHONE_INDEX_MIN_REFRESH = config("PHONE_INDEX_MIN_REFRESH", default=15, cast=int)
+
+users_by_phone = PhoneIndex("/api/auth/users/", PHONE_INDEX_TTL, PHONE_INDEX_MIN_REFRESH, require_telegram_id=True)
+clients_by_phone = PhoneIndex("/api/auth/users/by-role/2/", PHONE_INDEX_TTL, PHONE_INDEX_MIN_REFRESH)
+
+
+def _set_role(phone, role_id: int, present: bool) -> None:
+    users_by_phone.set_role(phone, role_id, present)
+    clients_by_phone.set_role(phone, role_id, present)
+
+
+invalidation.register("role", _set_role)
+
+
+def _on_role_change(phone, role_id: int, present: bool, result) -> None:
+    if result:
+        invalidation.publish("role", phone, role_id, present)
+        telegram_id = result.get("telegram_id") if isinstance(result, dict) else None
+        invalidate_profile(telegram_id or users_by_phone.telegram_id(phone=phone))
+
+
+def _on_user_change(user_id, result) -> None:
+    telegram_id = result.get("telegram_id") if isinstance(result, dict) else None
+    invalidate_profile(telegram_id or users_by_phone.telegram_id(user_id=user_id))
+
+
 async def get_user_by_id(telegram_id=None, id=None, phone=None):
     user = None
     if id is not None:
@@ -107,22 +475,22 @@ async def get_user_by_id(telegram_id=None, id=None, phone=None):
     elif telegram_id is not None:
         user = await api_request(method="GET", endpoint=f"/api/auth/users/if_exists/{telegram_id}/")
     elif phone is not None:
-        users = await get_users_all()
-        for u in users:
-            if u.get("phone_number") == phone:
-                user = u
-                break
+        user = await users_by_phone.get(phone)
 
-    if not user:
+    if not user or not isinstance(user, dict):
         return {}
 
-    lang_code = user.get("language", "").lower()
-    language = "🇺🇿 uz" if lang_code == "uz" else "🇷🇺 ru"
-    user["language"] = language
+    if phone is None:
+        users_by_phone.put(user)
+    user["language"] = _language_label(user.get("language"))
     return user
 
 async def update_user_by_id(user_id, data):
-    return await api_request("PATCH", f"/api/auth/users/{user_id}/", json=data)
+    result = await api_request("PATCH", f"/api/auth/users/{user_id}/", json=data)
+    invalidate_barbers()
+    invalidate_user(user_id)
+    _on_user_change(user_id, result)
+    return result
 
 ################################# ==== ROLES ==== #################################
 
@@ -133,14 +501,20 @@ async def get_directors_all():
 
 async def create_director_by_phone(director_phone):
     data = {"role_id": 3}
-    return await api_request("PATCH", f"/api/auth/users/add_role/{director_phone}/", json=data)
+    result = await api_request("PATCH", f"/api/auth/users/add_role/{director_phone}/", json=data)
+    _on_role_change(director_phone, 3, True, result)
+    return result
 
 async def update_director_by_id(director_id, data):
-    return await api_request("PATCH", f"/api/auth/users/{director_id}/", json=data)
+    result = await api_request("PATCH", f"/api/auth/users/{director_id}/", json=data)
+    _on_user_change(director_id, result)
+    return result
 
 async def delete_director_by_phone(director_phone):
     data = {"role_id": 3}
-    return await api_request("PATCH", f"/api/auth/users/remove_role/{director_phone}/", json=data)
+    result = await api_request("PATCH", f"/api/auth/users/remove_role/{director_phone}/", json=data)
+    _on_role_change(director_phone, 3, False, result)
+    return result
 
 
 # == ADMINS == #
@@ -150,20 +524,26 @@ async def get_admins_all():
 
 async def create_admin_by_phone(admin_phone):
     data = {"role_id": 4}
-    return await api_request("PATCH", f"/api/auth/users/add_role/{admin_phone}/", json=data)
+    result = await api_request("PATCH", f"/api/auth/users/add_role/{admin_phone}/", json=data)
+    _on_role_change(admin_phone, 4, True, result)
+    return result
 
 async def update_admin_by_id(admin_id, data):
-    return await api_request("PATCH", f"/api/auth/users/{admin_id}/", json=data)
+    result = await api_request("PATCH", f"/api/auth/users/{admin_id}/", json=data)
+    _on_user_change(admin_id, result)
+    return result
 
 async def delete_admin_by_phone(admin_phone):
     data = {"role_id": 4}
-    return await api_request("PATCH", f"/api/auth/users/remove_role/{admin_phone}/", json=data)
+    result = await api_request("PATCH", f"/api/auth/users/remove_role/{admin_phone}/", json=data)
+    _on_role_change(admin_phone, 4, False, result)
+    return result
 
 
 # == BARBERS == #
 async def get_barbers_all():
     role = 1
-    return await api_request(method="GET", endpoint=f"/api/auth/users/by-role/{role}/")
+    return await cached_get("barbers", role, f"/api/auth/users/by-role/{role}/")
 
 async def get_barber_rating_by_id(barber_id):
     return await api_request("GET", f"/api/auth/users/get_rating_by_barber_id/{barber_id}/")
@@ -173,17 +553,27 @@ async def get_barber_hours_by_telegram(telegram_id):
 
 async def create_barber_by_phone(barber_phone):
     data = {"role_id": 1}
-    return await api_request("PATCH", f"/api/auth/users/add_role/{barber_phone}/", json=data)
+    result = await api_request("PATCH", f"/api/auth/users/add_role/{barber_phone}/", json=data)
+    invalidate_barbers()
+    _on_role_change(barber_phone, 1, True, result)
+    return result
 
 async def update_barber_by_id(barber_id, data):
-    return await api_request("PATCH", f"/api/auth/users/{barber_id}/", json=data)
+    result = await api_request("PATCH", f"/api/auth/users/{barber_id}/", json=data)
+    invalidate_barbers()
+    invalidate_user(barber_id)
+    _on_user_change(barber_id, result)
+    return result
 
 async def update_working_hours_by_id(barber_id, data):
     return await api_request("PATCH", f"/api/booking/working-hours/barber/{barber_id}/set-hours/", json=data)
 
 async def delete_barber_by_phone(barber_phone):
     data = {"role_id": 1}
-    return await api_request("PATCH", f"/api/auth/users/remove_role/{barber_phone}/", json=data)
+    result = await api_request("PATCH", f"/api/auth/users/remove_role/{barber_phone}/", json=data)
+    invalidate_barbers()
+    _on_role_change(barber_phone, 1, False, result)
+    return result
 
 
 # == CLIENTS == #
@@ -191,19 +581,48 @@ async def get_clients_all():
     role = 2
     return await api_request(method="GET", endpoint=f"/api/auth/users/by-role/{role}/")
 
+CLIENTS_PAGE_SIZE = config("CLIENTS_PAGE_SIZE", default=500, cast=int)
+
+
+class ClientsPageError(Exception):
+    ## a page of the client list could not be loaded, the export would be incomplete
+    pass
+
+
+async def iter_clients(page_size: int = CLIENTS_PAGE_SIZE):
+    ## yields clients page by page; a backend without pagination answers with the whole list at once
+    role = 2
+    page = 1
+    while True:
+        body = await api_request("GET", f"/api/auth/users/by-role/{role}/", params={"page": page, "page_size": page_size})
+        if body is None or (page > 1 and not (isinstance(body, dict) and "results" in body)):
+            raise ClientsPageError(f"clients page {page} failed")
+        if isinstance(body, dict):
+            results = body.get("results") or []
+            if results:
+                yield results
+            if not body.get("next"):
+                return
+            page += 1
+            continue
+        if body:
+            yield body
+        return
+
 async def get_client_by_phone(client_phone):
-    clients = await get_clients_all()
-    for c in clients:
-        if c.get("phone_number") == client_phone:
-            return c
+    return await clients_by_phone.get(client_phone)
 
 async def ban_client_by_phone(client_phone):
     data = {"role_id": 5}
-    return await api_request("PATCH", f"/api/auth/users/add_role/{client_phone}/", json=data)
+    result = await api_request("PATCH", f"/api/auth/users/add_role/{client_phone}/", json=data)
+    _on_role_change(client_phone, 5, True, result)
+    return result
 
 async def unban_client_by_phone(client_phone):
     data = {"role_id": 5}
-    return await api_request("PATCH", f"/api/auth/users/remove_role/{client_phone}/", json=data)
+    result = await api_request("PATCH", f"/api/auth/users/remove_role/{client_phone}/", json=data)
+    _on_role_change(client_phone, 5, False, result)
+    return result
 
 
 ################################# ==== BARBER BOOKINGS ==== #################################
@@ -212,6 +631,36 @@ async def get_barber_bookings(barber_id, date):
     return await api_request("GET", f"/api/booking/get_bookings/{barber_id}/{date}/") or []
 
 
+async def _get_user_cached(user_id):
+    user = await cached_get("user", user_id, f"/api/auth/users/get_user_data/{user_id}/")
+    if not user or not isinstance(user, dict):
+        return {}
+    user["language"] = _language_label(user.get("language"))
+    return user
+
+async def hydrate_bookings(bookings):
+    ## replaces user/barber/service ids with their objects; every id of the batch is
+    ## fetched once and concurrently, repeats within CACHE_TTLS come from the cache
+    bookings = [dict(b) for b in bookings or [] if isinstance(b, dict)]
+    user_ids = list({b[f] for b in bookings for f in ("user", "barber") if isinstance(b.get(f), int)})
+    service_ids = list({b["service"] for b in bookings if isinstance(b.get("service"), int)})
+
+    users, services = await asyncio.gather(
+        asyncio.gather(*(_get_user_cached(i) for i in user_ids)),
+        asyncio.gather(*(get_barber_service_by_id(i) for i in service_ids)),
+    )
+    users = dict(zip(user_ids, users))
+    services = dict(zip(service_ids, services))
+
+    for b in bookings:
+        for f in ("user", "barber"):
+            if isinstance(b.get(f), int):
+                b[f] = users.get(b[f]) or {}
+        if isinstance(b.get("service"), int):
+            b["service"] = services.get(b["service"]) or {}
+    return bookings
+
+
 async def get_booking_by_id(booking_id):
     return await api_request("GET", f"/api/booking/get_bookings_by_id/{booking_id}/")
 
@@ -236,41 +685,53 @@ async def booking_forward_by_id(booking_id, barber_id):
 ################################# ==== BARBER TYPES ==== #################################
 
 async def get_barber_types_and_services(barber_id):
-    return await api_request("GET", f"/api/service-types/by-telegram/{barber_id}/") or []
+    return await cached_get("types_and_services", barber_id, f"/api/service-types/by-telegram/{barber_id}/") or []
 
 async def get_barber_types(barber_id):
-    return await api_request("GET", f"/api/service-types/only-type-by-telegram/{barber_id}/") or []
+    return await cached_get("types", barber_id, f"/api/service-types/only-type-by-telegram/{barber_id}/") or []
 
 async def create_barber_type(data):
-    return await api_request("POST", "/api/service-types/", json=data)
+    result = await api_request("POST", "/api/service-types/", json=data)
+    invalidate_catalog()
+    return result
 
 async def get_barber_type_by_id(type_id):
-    return await api_request("GET", f"/api/service-types/{type_id}/")
+    return await cached_get("type", type_id, f"/api/service-types/{type_id}/")
 
 async def update_barber_type_by_id(type_id, data):
-    return await api_request("PATCH", f"/api/service-types/{type_id}/", json=data)
+    result = await api_request("PATCH", f"/api/service-types/{type_id}/", json=data)
+    invalidate_catalog(type_id=type_id)
+    return result
 
 async def delete_barber_type_by_id(type_id):
-    return await api_request("DELETE", f"/api/service-types/{type_id}/")
+    result = await api_request("DELETE", f"/api/service-types/{type_id}/")
+    invalidate_catalog(type_id=type_id)
+    return result
 
 
 ################################# ==== BARBER SERVICES ==== #################################
 
 # == SERVICES == #
 async def get_barber_services(type_id):
-    return await api_request("GET", f"/api/services/{type_id}/get_services/") or []
+    return await cached_get("services", type_id, f"/api/services/{type_id}/get_services/") or []
 
 async def create_barber_service(data):
-    return await api_request("POST", "/api/services/", json=data)
+    result = await api_request("POST", "/api/services/", json=data)
+    invalidate_catalog(type_id=data.get("service_type"))
+    return result
 
 async def get_barber_service_by_id(service_id):
-    return await api_request("GET", f"/api/services/{service_id}/") or None
+    return await cached_get("service", service_id, f"/api/services/{service_id}/") or None
 
 async def update_barber_service_by_id(service_id, data):
-    return await api_request("PATCH", f"/api/services/{service_id}/", json=data)
+    result = await api_request("PATCH", f"/api/services/{service_id}/", json=data)
+    invalidate_catalog(type_id=data.get("service_type"), service_id=service_id)
+    return result
 
 async def delete_barber_service_by_id(service_id):
-    return await api_request("DELETE", f"/api/services/{service_id}/")
+    result = await api_request("DELETE", f"/api/services/{service_id}/")
+    invalidate_catalog(service_id=service_id)
+    return result
 
 ################################################################
 
@@ -294,7 +755,6 @@ async def delete_barber_break_by_id(break_id):
 
 
 async def create_user(telegram_id, phone, first_name, language):
-    url = f"{BASE_URL}/api/auth/register/"
     language = language.split(' ')[1]
     payload = {
         "telegram_id": telegram_id,
@@ -302,27 +762,10 @@ async def create_user(telegram_id, phone, first_name, language):
         "first_name": first_name,
         "language": language
     }
-
-    try:
-        async with aiohttp.ClientSession() as session:
-            async with session.post(url, data=payload) as response:
-
-                if response.status in [200, 201]:
-                    print("User created successfully.")
-                    return await response.json()
-
-                elif response.status == 400:
-                    error_data = await response.json()
-                    if 'telegram_id' in error_data and "already exist" in error_data['telegram_id'][0]:
-                        return None
-                    else:
-                        return False
-
-                return f"An error occurred: {response.status}"
-
-    except aiohttp.ClientError as e:
-        print(f"A network error occurred: {e}")
-        return "Network error."
+    result = await api_request("POST", "/api/auth/register/", data=payload)
+    ## drop the cached "not registered" answer
+    invalidate_profile(telegram_id)
+    return result
 
 
 async def user_booking_history(tg_id):
@@ -1,4 +1,4 @@
-import asyncio
+import os
 import re
 import logging
 
@@ -9,6 +9,7 @@ from aiogram.fsm.storage.base import StorageKey
 from datetime import datetime
 
 from configs import functions as cf
+from configs.broadcast import start_broadcast, album_media
 from databases import database as db
 from states import state as st
 from keyboards import reply as kb_r
@@ -86,6 +87,7 @@ async def show_error(entity, state, error_key: str = "unknown_command"):
 
 ## Booking info
 async def get_booking_info(lang, booking):
+    booking = (await db.hydrate_bookings([booking]))[0]
     barber = booking.get("barber")
     client = booking.get("user")
     service = booking.get("service")
@@ -93,13 +95,6 @@ async def get_booking_info(lang, booking):
     end_time = booking.get("end_time")
     status = booking.get("status")
 
-    if isinstance(barber, int):
-        barber = await db.get_user_by_id(id=barber)
-    if isinstance(client, int):
-        client = await db.get_user_by_id(id=client)
-    if isinstance(service, int):
-        service = await db.get_barber_service_by_id(service)
-
     def fmt_time(dt):
         try:
             t = datetime.fromisoformat(dt)
@@ -222,7 +217,6 @@ async def main_menu(message: Message, state: FSMContext):
         "bookings", "notifications", "settings", "clients", "analytics", "user_menu"
     ]
     buttons = {cf.get_text(lang, role, "button", k): k for k in button_keys}
-    admin_buttons = set(cf.get_admin_buttons(user_id) or [])
 
     async def send_menu(state_name, msg_key, reply_markup):
         await cf.get_random_modes(message, user_id, kb_r.ReplyKeyboardRemove)
@@ -245,7 +239,7 @@ async def main_menu(message: Message, state: FSMContext):
 
     btn_key = buttons.get(text)
     if btn_key:
-        if btn_key not in admin_buttons:
+        if not cf.has_admin_button(user_id, btn_key):
             await show_error(message, state, "no_access_button")
             return
         handler = handlers.get(btn_key)
@@ -362,7 +356,7 @@ async def input_text(message: Message, state: FSMContext):
 
 
 @router.message(st.admin.input_photo)
-async def input_photo(message: Message, state: FSMContext):
+async def input_photo(message: Message, state: FSMContext, album: list[str] | None = None):
     user_id, data, lang, text = await get_user_context(message, state)
 
     back_actions = {
@@ -383,9 +377,21 @@ async def input_photo(message: Message, state: FSMContext):
         await navigate_back_or_main(message, state, action["state"], action["text"], action["reply_markup"])
         return
     
+    if album:
+        await state.update_data(photo=None, photos=album)
+
+        reply_text = cf.get_text(lang, role, "message", "photo_accepted_msg")
+        await message.bot.send_message(
+            chat_id=user_id,
+            text=f"{reply_text} ({len(album)})",
+            reply_markup=kb_r.notifications(lang)
+        )
+        await state.set_state(st.admin.notifications)
+        return
+
     if message.photo:
         photo_id = message.photo[-1].file_id  
-        await state.update_data(photo=photo_id)
+        await state.update_data(photo=photo_id, photos=None)
 
         reply_text = cf.get_text(lang, role, "message", "photo_accepted_msg")
         await message.bot.send_photo(
@@ -469,10 +475,15 @@ async def check_post(message: Message, state: FSMContext):
     async def handle_preview():
         caption = data.get("description", "")
         photo = data.get("photo", "")
+        photos = data.get("photos") or []
         buttons = data.get("buttons", [])
         markup = kb_i.post_button(buttons) if buttons else None
 
-        if photo:
+        if photos:
+            await message.bot.send_media_group(user_id, album_media(photos, caption))
+            if markup:
+                await message.bot.send_message(user_id, "⬇️", reply_markup=markup)
+        elif photo:
             await message.bot.send_photo(
                 user_id,
                 photo=photo,
@@ -537,57 +548,20 @@ async def confirm_post(call: CallbackQuery, state: FSMContext):
         return
     
     if action == "confirm":
-        description = data.get("description")
-        photo = data.get("photo")
-        buttons = data.get("buttons", [])
-        reply_markup = kb_i.post_button(buttons) if buttons else None
-
         users = await db.get_users_all()
-        total = len(users)
-        sem = asyncio.Semaphore(20)
-        success = 0
-        failed = 0
-
-        def progress_bar(done: int, total: int, length: int = 20) -> str:
-            if total == 0:
-                return ""
-            filled = int(length * done / total)
-            return "█" * filled + "░" * (length - filled)
-
+        recipients = [u["telegram_id"] for u in users]
         status_msg = await call.message.edit_text(
-            f"📤 Начинаем рассылку...\n0 / {total}\n[░░░░░░░░░░░░░░░░░░░░]"
-        )
-
-        async def send_one(uid: int):
-            nonlocal success, failed
-            async with sem:
-                try:
-                    if photo:
-                        await call.bot.send_photo(uid, photo, caption=description, reply_markup=reply_markup, parse_mode="HTML")
-                    else:
-                        await call.bot.send_message(uid, description, reply_markup=reply_markup, parse_mode="HTML")
-                    success += 1
-                except Exception as e:
-                    failed += 1
-                    log.warning("Broadcast fail uid=%s: %s", uid, e)
-
-        CHUNK = 200
-        for i in range(0, total, CHUNK):
-            chunk = users[i:i+CHUNK]
-            await asyncio.gather(*(send_one(u["telegram_id"]) for u in chunk))
-
-            done = i + len(chunk)
-            bar = progress_bar(done, total)
-            await status_msg.edit_text(
-                f"📊 Прогресс: {done} / {total}\n[{bar}]"
-            )
-            await asyncio.sleep(0.1)
-
-        await state.update_data(description=None, photo=None, buttons=None)
-
-        datas = { "success": success, "failed": failed }
-        await status_msg.edit_text(cf.get_text(lang, role, "message", "post_sent_result").format(**datas), parse_mode="HTML")
+            f"📤 Начинаем рассылку...\n0 / {len(recipients)}\n[░░░░░░░░░░░░░░░░░░░░]"
+        )
+        await start_broadcast(
+            call.bot, status_msg, lang, role, recipients,
+            description=data.get("description"),
+            photo=data.get("photo"),
+            photos=data.get("photos"),
+            buttons=data.get("buttons") or [],
+        )
 
+        await state.update_data(description=None, photo=None, photos=None, buttons=None)
         await call.bot.send_message(user_id, cf.get_text(lang, role, "message", "main_menu_msg"), parse_mode="HTML", reply_markup=kb_r.ad_main_menu(lang, user_id))
         await state.set_state(st.admin.main_menu)
         await call.answer()
@@ -2828,19 +2802,27 @@ async def clients(call: CallbackQuery, state: FSMContext):
         return
     
     if action == "client_btn:list":
-        all_clients = await db.get_clients_all()
+        try:
+            document, path, last_clients = await cf.export_clients(db.iter_clients(), fmt="csv")
+        except db.ClientsPageError as e:
+            ## never send a truncated list that looks complete
+            log.error("clients export failed: %s", e)
+            await show_error(call, state, "export_failed_msg")
+            return
 
-        if not all_clients:
+        if not document:
             await call.answer(cf.get_text(lang, role, "message", "clients_not_msg"), show_alert=True)
             return
 
-        last_clients = all_clients[-5:]
         await call.message.delete()
-        await call.bot.send_document(
-            user_id,
-            document=cf.generate_clients_csv(all_clients),
-            caption=cf.get_text(lang, role, "message", "client_list_msg")
-        )
+        try:
+            await call.bot.send_document(
+                user_id,
+                document=document,
+                caption=cf.get_text(lang, role, "message", "client_list_msg")
+            )
+        finally:
+            os.remove(path)
         await call.bot.send_message(
             user_id,
             get_clients_info(lang, last_clients),
@@ -2910,7 +2892,6 @@ async def client_search(message: Message, state: FSMContext):
 
 @router.callback_query(F.data.startswith("cnt_detail_btn:"), st.admin.client_detail)
 async def client_detail(call: CallbackQuery, state: FSMContext):
-    from handlers.register_handlers import ban_mw
     user_id, data, lang, action = await get_user_context(call, state)
 
     if action == "cnt_detail_btn:back":
@@ -2933,7 +2914,7 @@ async def client_detail(call: CallbackQuery, state: FSMContext):
             await db.unban_client_by_phone(client.get("phone_number"))
             msg_key = "client_unban_msg"
 
-        ban_mw.invalidate(client_telegram_id)
+        db.invalidate_profile(client_telegram_id)
         client = await db.get_user_by_id(telegram_id=client_telegram_id)
         user_ban = 5 in (client.get("roles") or [])
 
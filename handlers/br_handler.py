@@ -54,17 +54,13 @@ async def get_times_of_bookings(my_infos, date):
 
 ## Booking info
 async def get_booking_info(lang, booking):
+    booking = (await db.hydrate_bookings([booking]))[0]
     client = booking.get("user")
     service = booking.get("service")
     start_time = booking.get("start_time")
     end_time = booking.get("end_time")
     status = booking.get("status")
 
-    if isinstance(client, int):
-        client = await db.get_user_by_id(id=client)
-    if isinstance(service, int):
-        service = await db.get_barber_service_by_id(service)
-
     def fmt_time(dt):
         try:
             t = datetime.fromisoformat(dt)
@@ -354,11 +350,12 @@ async def get_cabinet_info(my_infos, lang):
 
 
 @router.message(st.barber.main_menu)
-async def show_main_menu(message: Message, state: FSMContext):
+async def show_main_menu(message: Message, state: FSMContext, button_ids: dict | None = None):
     user_id, data, lang, text = await get_user_context(message, state)
     my_infos = data.get("my_infos")
+    action = (button_ids or {}).get(role)
 
-    if text == cf.get_text(lang, role, "button", "bookings"):
+    if action == "bookings":
         await message.bot.send_message(
             chat_id=user_id,
             text=cf.get_text(lang, role, "message", "bookings_msg"),
@@ -366,7 +363,7 @@ async def show_main_menu(message: Message, state: FSMContext):
         )
         await state.set_state(st.barber.bookings)
 
-    elif text == cf.get_text(lang, role, "button", "breaks"):
+    elif action == "breaks":
         await message.bot.send_message(
             chat_id=user_id,
             text=cf.get_text(lang, role, "message", "breaks_msg"),
@@ -374,7 +371,7 @@ async def show_main_menu(message: Message, state: FSMContext):
         )
         await state.set_state(st.barber.breaks)
 
-    elif text == cf.get_text(lang, role, "button", "types"):
+    elif action == "types":
         await message.bot.send_message(
             chat_id=user_id,
             text=await get_types_and_services_info(lang, my_infos.get("telegram_id")),
@@ -383,7 +380,7 @@ async def show_main_menu(message: Message, state: FSMContext):
         )
         await state.set_state(st.barber.types)
 
-    elif text == cf.get_text(lang, role, "button", "cabinet"):
+    elif action == "cabinet":
         msg = await get_cabinet_info(my_infos, lang)
         if my_infos.get("photo"):
             await message.bot.send_photo(
@@ -404,7 +401,7 @@ async def show_main_menu(message: Message, state: FSMContext):
 
         await state.set_state(st.barber.cabinet)
 
-    elif text == cf.get_text(lang, role, "button", "user_menu"):
+    elif action == "user_menu":
         await message.bot.send_message(
             chat_id=user_id,
             text=cf.get_text(lang, role, "message", "main_menu_msg"),
@@ -1173,6 +1170,7 @@ async def edit_language(message: Message, state: FSMContext):
 
     elif text in ["🇺🇿 uz", "🇷🇺 ru"]:
         await db.update_barber_by_id(my_infos.get("id"), {"language": "uz" if text.endswith("uz") else "ru"})
+        db.invalidate_profile(user_id)
         await message.bot.send_message(
             chat_id=user_id,
             text=cf.get_text(lang, role, "message", "language_select_msg"),
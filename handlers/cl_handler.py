@@ -213,7 +213,7 @@ async def check_conf_customer(message: Message, state: FSMContext):
 
 
 @router.message(st.user.main_menu)
-async def menu_check_button(message: Message, state: FSMContext):
+async def menu_check_button(message: Message, state: FSMContext, button_ids: dict | None = None):
     try:
         role = "client"
         user_id = message.from_user.id
@@ -225,18 +225,19 @@ async def menu_check_button(message: Message, state: FSMContext):
         barber_menu = "💈 Меню барбера"
         director_menu = "🛠 Меню директора"
         admin_menu = "👔 Меню менеджера"
+        action = (button_ids or {}).get(role)
 
-        if message.text == cf.get_text(lang, role,"buttons", "booking"):
+        if action == "booking":
             await message.bot.send_chat_action(chat_id=user_id, action=ChatAction.TYPING)
             reply_markup, _ = await kb.barber_name(lang)
             await message.answer(text=cf.get_text(lang, role,'message_text', 'barber_name'), reply_markup=reply_markup)
             await state.set_state(st.user.barber_name)
             
-        elif message.text == cf.get_text(lang, role,"buttons", "change_lang"):
+        elif action == "change_lang":
             await message.answer(text=cf.get_text(lang, role,'message_text', 'change_language'), reply_markup=kb.language(lang))
             await state.set_state(st.user.change_language)
 
-        elif message.text == cf.get_text(lang, role,"buttons", "booking_history"):
+        elif action == "booking_history":
             booking_history = await db.user_booking_history(user_id)
             if booking_history:
                 await message.bot.send_chat_action(chat_id=user_id, action=ChatAction.TYPING)
@@ -246,17 +247,17 @@ async def menu_check_button(message: Message, state: FSMContext):
             else:
                 await message.answer(text=cf.get_text(lang, role,'message_text', 'no_booking_history'))
 
-        elif message.text == cf.get_text(lang, role,"buttons", "contact_menu"):
+        elif action == "contact_menu":
             contact = cf.get_info_project().get("project_contact", {})
             await message.answer(
                 text=f"📞 {contact['contact']}\n✂️ {contact['barber_shop']}")
 
-        elif message.text == cf.get_text(lang, role,"buttons", "location"):
+        elif action == "location":
             location = cf.get_info_project().get("project_location", {})
             await message.bot.send_location(chat_id=user_id, latitude=location["latitude"], longitude=location["longitude"])
             await message.answer(text=f"📍 {location['address']}")
 
-        elif message.text == cf.get_text(lang, role,"buttons", "price_list"):
+        elif action == "price_list":
             price_list = cf.get_info_project().get("project_price_list", {})
             await message.answer(text=price_list["message"])
 
@@ -282,10 +283,11 @@ async def menu_check_button(message: Message, state: FSMContext):
 
             elif message.text == admin_menu and 4 in roles:
                 role = "director"
-                if kb.ad_main_menu(lang, user_id) is not None:
+                ad_menu = kb.ad_main_menu(lang, user_id)
+                if ad_menu is not None:
                     await message.answer(
                         text=cf.get_text(lang, role, "message", "main_menu_msg"),
-                        reply_markup=kb.ad_main_menu(lang, telegram_id=user_id)
+                        reply_markup=ad_menu
                     )
                     await state.set_state(st.admin.main_menu)
                     return
@@ -312,6 +314,7 @@ async def change_language(message: Message, state: FSMContext):
     elif message.text in ["🇺🇿 uz", "🇷🇺 ru"]:
         await state.update_data(lang=message.text)
         await db.update_user_by_id(my_infos["id"], {"language": "uz" if message.text == "🇺🇿 uz" else "ru"})
+        db.invalidate_profile(user_id)
         await message.answer(text=cf.get_text(message.text, role, 'message_text', 'menu'), reply_markup=kb.us_main_menu(message.text, my_infos.get("roles")))
         await state.set_state(st.user.main_menu)
 
@@ -338,8 +341,8 @@ async def booking_history(message: Message, state: FSMContext):
             if message.text == f"{day} {time}":
                 start_time = datetime.strptime(i["start_time"], "%Y-%m-%dT%H:%M:%S")
                 time = start_time.strftime("%d-%m-%Y %H:%M")
-                barber = await db.get_user_by_id(id=i["barber"])
-                service = await db.get_barber_service_by_id(service_id=i["service"])
+                booking = (await db.hydrate_bookings([i]))[0]
+                barber, service = booking["barber"], booking["service"]
                 booking_msg = (
                     f"📅 <b>Vaqt/Время</b>: {time}\n"
                     f"👤 <b>Barber/Барбер</b>: {barber['first_name']}\n"
@@ -1,4 +1,4 @@
-import asyncio
+import os
 import re
 import logging
 
@@ -8,8 +8,10 @@ from aiogram.fsm.context import FSMContext
 from aiogram.fsm.storage.base import StorageKey
 from datetime import datetime
 from typing import List, Dict, Any, Optional
+from decouple import config
 
 from configs import functions as cf
+from configs.broadcast import start_broadcast, album_media
 from databases import database as db
 from states import state as st
 from keyboards import reply as kb_r
@@ -22,6 +24,8 @@ log = logging.getLogger(__name__)
 
 role = "director"
 
+CLIENTS_EXPORT_FORMAT = config("CLIENTS_EXPORT_FORMAT", default="csv")
+
 # === Utils ===
 DURATION_RE = re.compile(r"^(\d{1,2}:\d{2}|\d{1,3})$")
 PRICE_RE = re.compile(r"\d+")
@@ -97,6 +101,7 @@ async def show_error(entity, state, error_key: str = "unknown_command"):
 
 ## Booking info
 async def get_booking_info(lang, booking):
+    booking = (await db.hydrate_bookings([booking]))[0]
     barber = booking.get("barber")
     client = booking.get("user")
     service = booking.get("service")
@@ -104,13 +109,6 @@ async def get_booking_info(lang, booking):
     end_time = booking.get("end_time")
     status = booking.get("status")
 
-    if isinstance(barber, int):
-        barber = await db.get_user_by_id(id=barber)
-    if isinstance(client, int):
-        client = await db.get_user_by_id(id=client)
-    if isinstance(service, int):
-        service = await db.get_barber_service_by_id(service)
-
     def fmt_time(dt):
         try:
             t = datetime.fromisoformat(dt)
@@ -551,7 +549,7 @@ async def input_text(message: Message, state: FSMContext):
 
 
 @router.message(st.director.input_photo)
-async def input_photo(message: Message, state: FSMContext):
+async def input_photo(message: Message, state: FSMContext, album: list[str] | None = None):
     user_id, data, lang, text = await get_user_context(message, state)
 
     back_actions = {
@@ -572,9 +570,21 @@ async def input_photo(message: Message, state: FSMContext):
         await navigate_back_or_main(message, state, action["state"], action["text"], action["reply_markup"])
         return
     
+    if album:
+        await state.update_data(photo=None, photos=album)
+
+        reply_text = cf.get_text(lang, role, "message", "photo_accepted_msg")
+        await message.bot.send_message(
+            chat_id=user_id,
+            text=f"{reply_text} ({len(album)})",
+            reply_markup=kb_r.notifications(lang)
+        )
+        await state.set_state(st.director.notifications)
+        return
+
     if message.photo:
         photo_id = message.photo[-1].file_id  
-        await state.update_data(photo=photo_id)
+        await state.update_data(photo=photo_id, photos=None)
 
         reply_text = cf.get_text(lang, role, "message", "photo_accepted_msg")
         await message.bot.send_photo(
@@ -658,10 +668,15 @@ async def check_post(message: Message, state: FSMContext):
     async def handle_preview():
         caption = data.get("description", "")
         photo = data.get("photo", "")
+        photos = data.get("photos") or []
         buttons = data.get("buttons", [])
         markup = kb_i.post_button(buttons) if buttons else None
 
-        if photo:
+        if photos:
+            await message.bot.send_media_group(user_id, album_media(photos, caption))
+            if markup:
+                await message.bot.send_message(user_id, "⬇️", reply_markup=markup)
+        elif photo:
             await message.bot.send_photo(
                 user_id,
                 photo=photo,
@@ -726,57 +741,20 @@ async def confirm_post(call: CallbackQuery, state: FSMContext):
         return
     
     if action == "confirm":
-        description = data.get("description")
-        photo = data.get("photo")
-        buttons = data.get("buttons", [])
-        reply_markup = kb_i.post_button(buttons) if buttons else None
-
         users = await db.get_users_all()
-        total = len(users)
-        sem = asyncio.Semaphore(20)
-        success = 0
-        failed = 0
-
-        def progress_bar(done: int, total: int, length: int = 20) -> str:
-            if total == 0:
-                return ""
-            filled = int(length * done / total)
-            return "█" * filled + "░" * (length - filled)
-
+        recipients = [u["telegram_id"] for u in users]
         status_msg = await call.message.edit_text(
-            f"📤 Начинаем рассылку...\n0 / {total}\n[░░░░░░░░░░░░░░░░░░░░]"
-        )
-
-        async def send_one(uid: int):
-            nonlocal success, failed
-            async with sem:
-                try:
-                    if photo:
-                        await call.bot.send_photo(uid, photo, caption=description, reply_markup=reply_markup, parse_mode="HTML")
-                    else:
-                        await call.bot.send_message(uid, description, reply_markup=reply_markup, parse_mode="HTML")
-                    success += 1
-                except Exception as e:
-                    failed += 1
-                    log.warning("Broadcast fail uid=%s: %s", uid, e)
-
-        CHUNK = 200
-        for i in range(0, total, CHUNK):
-            chunk = users[i:i+CHUNK]
-            await asyncio.gather(*(send_one(u["telegram_id"]) for u in chunk))
-
-            done = i + len(chunk)
-            bar = progress_bar(done, total)
-            await status_msg.edit_text(
-                f"📊 Прогресс: {done} / {total}\n[{bar}]"
-            )
-            await asyncio.sleep(0.1)
-
-        await state.update_data(description=None, photo=None, buttons=None)
-
-        datas = { "success": success, "failed": failed }
-        await status_msg.edit_text(cf.get_text(lang, role, "message", "post_sent_result").format(**datas), parse_mode="HTML")
+            f"📤 Начинаем рассылку...\n0 / {len(recipients)}\n[░░░░░░░░░░░░░░░░░░░░]"
+        )
+        await start_broadcast(
+            call.bot, status_msg, lang, role, recipients,
+            description=data.get("description"),
+            photo=data.get("photo"),
+            photos=data.get("photos"),
+            buttons=data.get("buttons") or [],
+        )
 
+        await state.update_data(description=None, photo=None, photos=None, buttons=None)
         await call.bot.send_message(user_id, cf.get_text(lang, role, "message", "main_menu_msg"), parse_mode="HTML", reply_markup=kb_r.dr_main_menu(lang))
         await state.set_state(st.director.main_menu)
         await call.answer()
@@ -786,15 +764,9 @@ async def confirm_post(call: CallbackQuery, state: FSMContext):
 ##################################################################################################################
 
 @router.message(st.director.bookings)
-async def bookings(message: Message, state: FSMContext):
+async def bookings(message: Message, state: FSMContext, button_ids: dict | None = None):
     user_id, data, lang, text = await get_user_context(message, state)
 
-    t_back = cf.get_text(lang, role, "button", "back")
-    t_today = cf.get_text(lang, role, "button", "bookings_today")
-    t_otherday = cf.get_text(lang, role, "button", "bookings_otherday")
-    t_cancel = cf.get_text(lang, role, "button", "bookings_cancel")
-    t_forward = cf.get_text(lang, role, "button", "bookings_forward")
-
     async def handle_back():
         await message.bot.send_message(
             user_id,
@@ -845,13 +817,13 @@ async def bookings(message: Message, state: FSMContext):
         await state.set_state(st.director.bookings_forward)
         
     handlers = {
-        t_back: handle_back,
-        t_today: handle_books_today,
-        t_otherday: handle_books_otherday,
-        t_cancel: handle_books_cancel,
-        t_forward: handle_books_forward
+        "back": handle_back,
+        "bookings_today": handle_books_today,
+        "bookings_otherday": handle_books_otherday,
+        "bookings_cancel": handle_books_cancel,
+        "bookings_forward": handle_books_forward
     }
-    handle = handlers.get(text)
+    handle = handlers.get((button_ids or {}).get(role))
 
     if handle:
         await handle()
@@ -3057,19 +3029,27 @@ async def clients(call: CallbackQuery, state: FSMContext):
         return
     
     if action == "client_btn:list":
-        all_clients = await db.get_clients_all()
+        try:
+            document, path, last_clients = await cf.export_clients(db.iter_clients(), fmt=CLIENTS_EXPORT_FORMAT)
+        except db.ClientsPageError as e:
+            ## never send a truncated list that looks complete
+            log.error("clients export failed: %s", e)
+            await show_error(call, state, "export_failed_msg")
+            return
 
-        if not all_clients:
+        if not document:
             await call.answer(cf.get_text(lang, role, "message", "clients_not_msg"), show_alert=True)
             return
 
-        last_clients = all_clients[-5:]
         await call.message.delete()
-        await call.bot.send_document(
-            user_id,
-            document=cf.generate_clients_csv(all_clients),
-            caption=cf.get_text(lang, role, "message", "client_list_msg")
-        )
+        try:
+            await call.bot.send_document(
+                user_id,
+                document=document,
+                caption=cf.get_text(lang, role, "message", "client_list_msg")
+            )
+        finally:
+            os.remove(path)
         await call.bot.send_message(
             user_id,
             get_clients_info(lang, last_clients),
@@ -3139,7 +3119,6 @@ async def client_search(message: Message, state: FSMContext):
 
 @router.callback_query(F.data.startswith("cnt_detail_btn:"), st.director.client_detail)
 async def client_detail(call: CallbackQuery, state: FSMContext):
-    from handlers.register_handlers import ban_mw
     user_id, data, lang, action = await get_user_context(call, state)
 
     if action == "cnt_detail_btn:back":
@@ -3162,7 +3141,7 @@ async def client_detail(call: CallbackQuery, state: FSMContext):
             await db.unban_client_by_phone(client.get("phone_number"))
             msg_key = "client_unban_msg"
 
-        ban_mw.invalidate(client_telegram_id)
+        db.invalidate_profile(client_telegram_id)
         client = await db.get_user_by_id(telegram_id=client_telegram_id)
         user_ban = 5 in (client.get("roles") or [])
 
@@ -1,8 +1,7 @@
-import random, asyncio
 from datetime import datetime, timezone, timedelta
 
 from aiogram import Router, F
-from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup, Message, CallbackQuery, ReplyKeyboardRemove
+from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup, Message, CallbackQuery
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import StatesGroup, State
@@ -10,6 +9,8 @@ from aiogram.fsm.state import StatesGroup, State
 from databases import database as db
 from configs import functions as cf
 from configs.survey_storage import remove
+from configs.broadcast import send_limited
+from middlewares.keyboard_swap import keyboard_swap
 from states import state as st
 from keyboards import reply as kb
 
@@ -47,15 +48,20 @@ def _iso_to_local(s: str) -> datetime:
         dt = dt.replace(tzinfo=TZ_TASHKENT)
     return dt.astimezone(TZ_TASHKENT)
 
-async def send_survey_message(bot, state: FSMContext, user_id: int, telegram_id: int, booking_id: int, barber_id: int, lang: str):
-    booking = await db.get_booking_by_id(booking_id)
+async def send_survey_message(bot, state: FSMContext, user_id: int, telegram_id: int, booking_id: int, barber_id: int, lang: str,
+                              booking: dict | None = None, barber: dict | None = None, service: dict | None = None):
+    ## booking/barber/service may be prefetched by the dispatcher for a whole batch
+    if booking is None:
+        booking = await db.get_booking_by_id(booking_id)
 
     if booking:
         start_local = _iso_to_local(booking.get("start_time"))
         end_local   = _iso_to_local(booking.get("end_time"))
         time_str = f"{start_local:%d.%m.%Y %H:%M}–{end_local:%H:%M}"
-        barber = await db.get_user_by_id(id=barber_id)
-        service = await db.get_barber_service_by_id(booking.get("service_id"))
+        if barber is None:
+            barber = await db.get_user_by_id(id=barber_id)
+        if service is None:
+            service = await db.get_barber_service_by_id(booking.get("service_id")) or {}
 
         barber_name = (barber.get("first_name") or f"#{barber_id}")
         service_name = (service.get("name") or "—")
@@ -79,15 +85,10 @@ async def send_survey_message(bot, state: FSMContext, user_id: int, telegram_id:
         text = cf.get_text(lang, "survey", "ask_rating")
         parse_mode = None
 
-    msg = await bot.send_message(user_id, random.choice(cf.SECRET_MESSAGES), reply_markup=ReplyKeyboardRemove())
-    await asyncio.sleep(0.025)
-    try:
-        await msg.delete()
-    except Exception:
-        pass
-
-    await bot.send_message(
-        chat_id=user_id,
+    keyboard_swap.remove_keyboard(telegram_id)
+    await send_limited(
+        bot.send_message,
+        chat_id=telegram_id,
         text=text,
         parse_mode=parse_mode,
         reply_markup=stars_kb(booking_id, barber_id, user_id)
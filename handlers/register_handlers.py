@@ -10,9 +10,19 @@ from configs import functions as cf
 from keyboards import reply as kb
 from states import state as st
 from databases import database as db
+from configs.fsm_storage import build_storage
+from configs.media_registry import send_static_photo
+from middlewares.keyboard_swap import keyboard_swap, KeyboardSwapRequestMiddleware, KeyboardSwapFlushMiddleware
+from middlewares.button_action import ButtonActionMiddleware
+from middlewares.album import AlbumMiddleware
 
 bot = Bot(config("TOKEN"))
-dp = Dispatcher()
+bot.session.middleware(KeyboardSwapRequestMiddleware(keyboard_swap))
+dp = Dispatcher(storage=build_storage())
+dp.update.outer_middleware(KeyboardSwapFlushMiddleware(keyboard_swap))
+dp.message.outer_middleware(ButtonActionMiddleware())
+## only the broadcast photo steps accept albums
+dp.message.outer_middleware(AlbumMiddleware(states=(st.director.input_photo, st.admin.input_photo)))
 router = Router()
 
 ROLE_BARBER, ROLE_CLIENT, ROLE_DIRECTOR, ROLE_ADMIN = 1, 2, 3, 4
@@ -25,9 +35,10 @@ def pick_role(roles: list[int]) -> int:
     return ROLE_CLIENT
 
 @router.message(Command("start"))
-async def cmd_start(message: Message, state: FSMContext):
+async def cmd_start(message: Message, state: FSMContext, user: dict | None = None):
     uid = message.from_user.id
-    user = await db.get_user_by_id(telegram_id=uid)
+    if user is None:
+        user = await db.get_user_by_id(telegram_id=uid)
 
     if not user:
         await message.bot.send_message(uid, cf.translations["start"], reply_markup=kb.start_key())
@@ -45,17 +56,15 @@ async def cmd_start(message: Message, state: FSMContext):
     }[role]
     _, kb_builder, sts = caption_key
     caption = cf.get_text(lang, "start_msg")
-    photo = cf.get_logo_file()
-
-    if photo:
-        await bot.send_photo(
-            chat_id=uid,
-            photo=photo,
-            caption=caption,
-            parse_mode="HTML",
-            reply_markup=kb_builder,
-        )
-    else:
+    sent = await send_static_photo(
+        bot,
+        uid,
+        cf.LOGO_PATH,
+        caption=caption,
+        parse_mode="HTML",
+        reply_markup=kb_builder,
+    )
+    if not sent:
         await bot.send_message(uid, caption, reply_markup=kb_builder)
 
     await state.update_data(lang=lang, my_infos=user)
@@ -63,9 +72,10 @@ async def cmd_start(message: Message, state: FSMContext):
 
 
 @router.callback_query(F.data, StateFilter(default_state))
-async def cmd_bot_cb(call: CallbackQuery, state: FSMContext):
+async def cmd_bot_cb(call: CallbackQuery, state: FSMContext, user: dict | None = None):
     uid = call.from_user.id
-    user = await db.get_user_by_id(telegram_id=uid)
+    if user is None:
+        user = await db.get_user_by_id(telegram_id=uid)
 
     if not user:  
         await call.bot.send_message(uid, cf.translations["start"], reply_markup=kb.start_key())
@@ -84,19 +94,18 @@ async def cmd_bot_cb(call: CallbackQuery, state: FSMContext):
     }[role]
     _, kb_builder, sts = caption_key
     caption = cf.get_text(lang, "start_msg")
-    photo = cf.get_logo_file()
 
     await call.message.delete()
 
-    if photo:
-        await call.bot.send_photo(
-            chat_id=uid,
-            photo=photo,
-            caption=caption,
-            parse_mode="HTML",
-            reply_markup=kb_builder,
-        )
-    else:
+    sent = await send_static_photo(
+        call.bot,
+        uid,
+        cf.LOGO_PATH,
+        caption=caption,
+        parse_mode="HTML",
+        reply_markup=kb_builder,
+    )
+    if not sent:
         await call.bot.send_message(uid, caption, reply_markup=kb_builder)
 
     await state.update_data(lang=lang, my_infos=user)
@@ -106,9 +115,10 @@ async def cmd_bot_cb(call: CallbackQuery, state: FSMContext):
 
 
 @router.message(F.text, StateFilter(default_state))
-async def cmd_bot(message: Message, state: FSMContext):
+async def cmd_bot(message: Message, state: FSMContext, user: dict | None = None):
     uid = message.from_user.id
-    user = await db.get_user_by_id(telegram_id=uid)
+    if user is None:
+        user = await db.get_user_by_id(telegram_id=uid)
 
     if not user: 
         await message.bot.send_message(uid, cf.translations["start"], reply_markup=kb.start_key())
@@ -126,17 +136,15 @@ async def cmd_bot(message: Message, state: FSMContext):
     }[role]
     _, kb_builder, sts = caption_key
     caption = cf.get_text(lang, "start_msg")
-    photo = cf.get_logo_file()
-
-    if photo:
-        await bot.send_photo(
-            chat_id=uid,
-            photo=photo,
-            caption=caption,
-            parse_mode="HTML",
-            reply_markup=kb_builder,
-        )
-    else:
+    sent = await send_static_photo(
+        bot,
+        uid,
+        cf.LOGO_PATH,
+        caption=caption,
+        parse_mode="HTML",
+        reply_markup=kb_builder,
+    )
+    if not sent:
         await bot.send_message(uid, caption, reply_markup=kb_builder)
 
     await state.update_data(lang=lang, my_infos=user)
@@ -156,7 +164,10 @@ router.include_router(barber_router)
 router.include_router(admin_router)
 router.include_router(director_router)
 
-ban_mw = BanMiddleware(ttl_seconds=45)
+ban_mw = BanMiddleware(
+    ttl_seconds=45,
+    max_size=config("BAN_CACHE_MAX_SIZE", default=20000, cast=int),
+)
 router.message.middleware(ban_mw)
 router.callback_query.middleware(ban_mw)
 
@@ -3,9 +3,11 @@ from aiogram.utils.keyboard import InlineKeyboardBuilder
 
 from configs import functions as cf
 from databases import database as db
+from keyboards.static import static_keyboard
 
 role = "director"
 
+@static_keyboard
 def back_main(lang):
     kb = InlineKeyboardBuilder()
     kb.row(
@@ -13,6 +15,7 @@ def back_main(lang):
         InlineKeyboardButton(text=cf.get_text(lang, role, "button", "back"), callback_data="back"))
     return kb.as_markup()
 
+@static_keyboard
 def confirm_reject(lang):
     kb = InlineKeyboardBuilder()
     kb.row(
@@ -71,6 +74,7 @@ async def booking_detail(lang, booking_id):
 
 ################################################################################
 
+@static_keyboard
 def settings(lang: str, manager: str):
     kb = InlineKeyboardBuilder()
     kb.row(
@@ -124,6 +128,7 @@ async def barber_services(lang, type_id):
            InlineKeyboardButton(text=cf.get_text(lang, role, "button", "back"), callback_data="service_btn:back"))
     return kb.as_markup()
 
+@static_keyboard
 def service_detail(lang):
     kb = InlineKeyboardBuilder()
     kb.add(
@@ -152,6 +157,7 @@ async def barbers(lang):
     )
     return kb.as_markup()
 
+@static_keyboard
 def barber_detail(lang):
     kb = InlineKeyboardBuilder()
     kb.add(
@@ -180,6 +186,7 @@ async def admins(lang):
     )
     return kb.as_markup()
 
+@static_keyboard
 def admin_detail(lang):
     kb = InlineKeyboardBuilder()
     kb.add(
@@ -206,6 +213,7 @@ def build_admin_buttons_editor(lang: str, selected: set[str]):
             InlineKeyboardButton(text=cf.get_text(lang, role, "button", "back"), callback_data="adm_btn:back"))
     return kb.as_markup()
 
+@static_keyboard
 def infos(lang):
     kb = InlineKeyboardBuilder()
     kb.add(
@@ -218,6 +226,7 @@ def infos(lang):
     kb.adjust(1, 2, 2)
     return kb.as_markup()
 
+@static_keyboard
 def language(lang):
     kb = InlineKeyboardBuilder()
     kb.add( 
@@ -231,6 +240,7 @@ def language(lang):
 
 ################################################################
 
+@static_keyboard
 def clients(lang):
     kb = InlineKeyboardBuilder()
     kb.add(
@@ -5,15 +5,18 @@ from aiogram.utils.keyboard import ReplyKeyboardBuilder
 
 from configs import functions as cf
 from databases import database as db
+from keyboards.static import static_keyboard
 
 role = "director"
 
+@static_keyboard
 def back(lang):
     keyboard = ReplyKeyboardBuilder()
     keyboard.row(KeyboardButton(text=cf.get_text(lang, role, "button", "back")))
     return keyboard.as_markup(resize_keyboard=True, input_field_placeholder=cf.translations["input_field_msg"])
 
 
+@static_keyboard
 def back_main(lang):
     keyboard = ReplyKeyboardBuilder()
     keyboard.row(
@@ -22,12 +25,14 @@ def back_main(lang):
     return keyboard.as_markup(resize_keyboard=True, input_field_placeholder=cf.translations["input_field_msg"])
 
 
+@static_keyboard
 def confirm_reject(lang):
     keyboard = ReplyKeyboardBuilder()
     keyboard.row(KeyboardButton(text=cf.get_text(lang, role, "button", "confirm")))
     keyboard.row(KeyboardButton(text=cf.get_text(lang, role, "button", "back_main")), KeyboardButton(text=cf.get_text(lang, role, "button", "back")))
     return keyboard.as_markup(resize_keyboard=True, input_field_placeholder=cf.translations["input_field_msg"])
 
+@static_keyboard
 def location_back(lang):
     kb = ReplyKeyboardBuilder()
     kb.row(KeyboardButton(text=cf.get_text(lang, role, "button", "location"), request_location=True))
@@ -38,8 +43,11 @@ def location_back(lang):
 
 def us_main_menu(lang: str, roles: list[int] | None = None):
     roles = roles or []
-    role_keys = {cf.ROLE_ID_TO_KEY[r] for r in roles if r in cf.ROLE_ID_TO_KEY}
+    return _us_main_menu(lang, frozenset(cf.ROLE_ID_TO_KEY[r] for r in roles if r in cf.ROLE_ID_TO_KEY))
 
+
+@static_keyboard
+def _us_main_menu(lang: str, role_keys: frozenset[str]):
     kb = ReplyKeyboardBuilder()
 
     if not role_keys or "client" in role_keys:
@@ -73,6 +81,7 @@ def us_main_menu(lang: str, roles: list[int] | None = None):
     return kb.as_markup(resize_keyboard=True, input_field_placeholder=placeholder)
 
 
+@static_keyboard
 def br_main_menu(lang):
     kb = ReplyKeyboardBuilder()
     role = "barber"
@@ -87,8 +96,13 @@ def br_main_menu(lang):
     return kb.as_markup(resize_keyboard=True, input_field_placeholder=cf.translations["input_field_msg"])
 
 def ad_main_menu(lang, telegram_id):
+    ## keyed by the button set itself, so editing an admin's buttons needs no invalidation
+    return _ad_main_menu(lang, tuple(cf.get_admin_buttons(telegram_id)))
+
+
+@static_keyboard
+def _ad_main_menu(lang, buttons: tuple[str, ...]):
     kb = ReplyKeyboardBuilder()
-    buttons = cf.get_admin_buttons(telegram_id)
     if buttons:
         for btn in buttons:
             kb.row(KeyboardButton(text=cf.get_text(lang, role, "button", btn)))
@@ -98,6 +112,7 @@ def ad_main_menu(lang, telegram_id):
         return None
 
 
+@static_keyboard
 def dr_main_menu(lang):
     keyboard = ReplyKeyboardBuilder()
     keyboard.row(
@@ -113,6 +128,7 @@ def dr_main_menu(lang):
 
 ##################################################### NOTIFICATION  #############################################################
 
+@static_keyboard
 def notifications(lang):
     keyboard = ReplyKeyboardBuilder()
     keyboard.add(
@@ -123,6 +139,7 @@ def notifications(lang):
     keyboard.row(KeyboardButton(text=cf.get_text(lang, role, "button", "back")))
     return keyboard.as_markup(resize_keyboard=True, input_field_placeholder=cf.translations["input_field_msg"])
 
+@static_keyboard
 def check_post(lang):
     keyboard = ReplyKeyboardBuilder()
     keyboard.add(
@@ -134,6 +151,7 @@ def check_post(lang):
 
 ###################################################### BOOKINGS ############################################################
 
+@static_keyboard
 def br_bookings(lang):
     kb = ReplyKeyboardBuilder()
     role = "barber"
@@ -166,6 +184,7 @@ def br_bookings_otherday(lang):
     return kb.as_markup(resize_keyboard=True, input_field_placeholder=cf.translations["input_field_msg"])
 
 
+@static_keyboard
 def bookings(lang):
     keyboard = ReplyKeyboardBuilder()
     keyboard.add(
@@ -196,6 +215,7 @@ async def bookings_otherday(lang):
 
 ######################################################## BREAKS ##########################################################
 
+@static_keyboard
 def br_breaks(lang):
     kb = ReplyKeyboardBuilder()
     role = "barber"
@@ -249,6 +269,7 @@ async def br_services(lang, type_id):
     return kb.as_markup(resize_keyboard=True, input_field_placeholder=cf.translations["input_field_msg"])
 
 
+@static_keyboard
 def br_service_detail(lang):
     kb = ReplyKeyboardBuilder()
     role = "barber"
@@ -261,6 +282,7 @@ def br_service_detail(lang):
 
 ######################################################## CABINET ##########################################################
 
+@static_keyboard
 def br_cabinet(lang):
     kb = ReplyKeyboardBuilder()
     role = "barber"
@@ -274,6 +296,7 @@ def br_cabinet(lang):
     )
     return kb.as_markup(resize_keyboard=True, input_field_placeholder=cf.translations["input_field_msg"])
 
+@static_keyboard
 def br_cabinet_language(lang):
     kb = ReplyKeyboardBuilder()
     role = "barber"
@@ -287,6 +310,7 @@ def br_cabinet_language(lang):
 
 ######################################################## ANALYTIC ##########################################################
 
+@static_keyboard
 def analytics(lang):
     kb = ReplyKeyboardBuilder()
     kb.row(
@@ -301,6 +325,7 @@ def analytics(lang):
 
 ###################################################  USER  #############################################################
 
+@static_keyboard
 def start_key():
     keyboard = ReplyKeyboardBuilder()
     keyboard.add(KeyboardButton(text="🇺🇿 uz"), KeyboardButton(text="🇷🇺 ru"))
@@ -308,6 +333,7 @@ def start_key():
     return keyboard.as_markup(resize_keyboard=True)
 
 
+@static_keyboard
 def ask_phone(lang):
     keyboard = ReplyKeyboardBuilder()
     keyboard.add(KeyboardButton(text=cf.get_text(lang, "client", "buttons", "contact"), request_contact=True))
@@ -315,6 +341,7 @@ def ask_phone(lang):
     return keyboard.as_markup(resize_keyboard=True)
 
 
+@static_keyboard
 def conf(lang):
     keyboard = ReplyKeyboardBuilder()
     keyboard.add(KeyboardButton(text=cf.get_text(lang, "client", "buttons", "confirm")), KeyboardButton(text=cf.get_text(lang, "client", "buttons", "rejected")))
@@ -322,6 +349,7 @@ def conf(lang):
     return keyboard.as_markup(resize_keyboard=True)
 
 
+@static_keyboard
 def back(lang):
     keyboard = ReplyKeyboardBuilder()
     keyboard.add(KeyboardButton(text=cf.get_text(lang, "client", "buttons", "back")))
@@ -329,6 +357,7 @@ def back(lang):
     return keyboard.as_markup(resize_keyboard=True)
 
 
+@static_keyboard
 def language(lang):
     keyboard = ReplyKeyboardBuilder()
     keyboard.add(KeyboardButton(text="🇺🇿 uz"), KeyboardButton(text="🇷🇺 ru"),
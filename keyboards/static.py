@@ -0,0 +1,33 @@
+import functools
+
+from configs import functions as cf
+
+## every memoized keyboard registers its cache here so a translations reload can drop them all
+_caches: list[dict] = []
+_seen_version = cf.catalog_version
+
+
+def invalidate_keyboards() -> None:
+    for cache in _caches:
+        cache.clear()
+
+
+def static_keyboard(func):
+    ## builds a keyboard once per distinct (hashable) arguments and serves the same markup
+    ## afterwards; the markup is shared between users, callers must not modify it
+    cache: dict = {}
+    _caches.append(cache)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        global _seen_version
+        if _seen_version != cf.catalog_version:
+            invalidate_keyboards()
+            _seen_version = cf.catalog_version
+        key = (args, tuple(sorted(kwargs.items())))
+        if key not in cache:
+            cache[key] = func(*args, **kwargs)
+        return cache[key]
+
+    wrapper.cache = cache
+    return wrapper
@@ -8,9 +8,14 @@ from aiohttp import web
 from decouple import config
 from pydantic import ValidationError
 
-from handlers.register_handlers import bot, dp
-from databases.database import close_session 
-from configs.app_scheduler import get_scheduler, run_survey_dispatch
+from handlers.register_handlers import bot, dp, ban_mw
+from databases.database import close_session, warm_up_pool, get_api_stats
+from configs.app_scheduler import SurveyTimer
+from configs.workers import WEBHOOK_WORKERS, WorkerPool
+from configs.update_queue import WEBHOOK_ASYNC, UpdateQueue, feed_and_report
+from configs.update_dedup import UpdateDeduplicator
+from configs.broadcast import resume_broadcasts, broadcast_stats
+from middlewares.keyboard_swap import keyboard_swap
 
 
 # -------------------- logging --------------------
@@ -28,27 +33,27 @@ WEBHOOK_PATH = f"/webhook/{WEBHOOK_SECRET}" if WEBHOOK_SECRET else "/webhook"
 WEBHOOK_HOST = config("WEBHOOK_URL", default="")
 WEBHOOK_URL = f"{WEBHOOK_HOST}/webhook" if WEBHOOK_HOST else ""
 
+workers_key = web.AppKey("workers", WorkerPool)
+queue_key = web.AppKey("update_queue", UpdateQueue)
+dedup_key = web.AppKey("dedup", UpdateDeduplicator)
+survey_key = web.AppKey("survey_timer", SurveyTimer)
+
 # -------------------- lifecycle hooks --------------------
 async def on_startup(app: web.Application):
+    await warm_up_pool()
+    app[dedup_key] = UpdateDeduplicator()
+    app[dedup_key].open()
+    if WEBHOOK_WORKERS > 1:
+        app[workers_key] = WorkerPool(WEBHOOK_WORKERS)
+        await app[workers_key].start()
+    elif WEBHOOK_ASYNC:
+        app[queue_key] = UpdateQueue(lambda update: feed_and_report(bot, dp, update))
+        app[queue_key].start()
+    ## jobs owned by live workers are resumed by those workers
+    await resume_broadcasts(bot, workers=WEBHOOK_WORKERS if workers_key in app else 0)
+    app[survey_key] = SurveyTimer(bot)
+    await app[survey_key].start()
     if WEBHOOK_URL:
-        sch = get_scheduler()
-        try:
-            sch.remove_job("survey-pull")
-        except Exception:
-            pass
-
-        sch.add_job(
-            run_survey_dispatch,
-            "cron",
-            minute="*/30",
-            args=[bot],
-            id="survey-pull"
-        )
-        if not sch.running:
-            sch.start()
-
-        sch.print_jobs()
-
         await bot.set_webhook(
             WEBHOOK_URL,
             allowed_updates=["message", "callback_query"]
@@ -74,36 +79,91 @@ async def on_shutdown(app: web.Application):
 
 async def on_cleanup(app: web.Application):
     try:
-        sch = get_scheduler()
-        if sch.running:
-            sch.shutdown(wait=False)
+        if workers_key in app:
+            await app[workers_key].stop()
+        if queue_key in app:
+            await app[queue_key].stop()
+        if dedup_key in app:
+            app[dedup_key].close()
+        if survey_key in app:
+            await app[survey_key].stop()
+        await ban_mw.close()
+        await dp.storage.close()
         await close_session()
     except Exception as e:
         logger.exception("Ошибка при закрытии клиентской сессии: %s", e)
 
 
 # -------------------- handlers --------------------
-async def health(_request: web.Request):
-    return web.json_response({"status": "ok"})
+async def health(request: web.Request):
+    pool = request.app.get(workers_key)
+    if pool is None:
+        return web.json_response({"status": "ok"})
+    workers = pool.status()
+    status = "ok" if all(w["ready"] for w in workers) else "degraded"
+    return web.json_response({"status": status, "restarts": pool.restarts, "workers": workers})
+
+async def ready(request: web.Request):
+    pool = request.app.get(workers_key)
+    if pool is not None and not pool.ready():
+        return web.json_response({"ready": False, "workers": pool.status()}, status=503)
+    return web.json_response({"ready": True})
+
+async def metrics(request: web.Request):
+    payload = {"api": get_api_stats(), "ban_cache": ban_mw.stats(), "broadcast": broadcast_stats(), "keyboard_swap": keyboard_swap.metrics()}
+    if queue_key in request.app:
+        payload["update_queue"] = request.app[queue_key].metrics()
+    if dedup_key in request.app:
+        payload["dedup"] = request.app[dedup_key].metrics()
+    if survey_key in request.app:
+        payload["survey"] = request.app[survey_key].metrics()
+    return web.json_response(payload)
 
 async def handle(request: web.Request):
+    dedup = request.app[dedup_key]
+    pool = request.app.get(workers_key)
+    if pool is not None:
+        try:
+            data = await request.json()
+        except JSONDecodeError as e:
+            logger.warning("Некорректный апдейт/JSON: %s", e)
+            return web.Response(status=200)
+        if not isinstance(data, dict):
+            logger.warning("Некорректный апдейт: %s", type(data).__name__)
+            return web.Response(status=400, text="bad update")
+        if "update_id" in data and dedup.is_duplicate(data["update_id"]):
+            return web.Response(status=200)
+        if not pool.submit(data):
+            ## worker queue is full: let Telegram retry later
+            dedup.forget(data.get("update_id"))
+            return web.Response(status=503, text="busy")
+        return web.Response(status=200)
+
     try:
         data = await request.json()
         update = Update.model_validate(data)
-        await dp.feed_update(bot, update)
     except (JSONDecodeError, ValidationError) as e:
         logger.warning("Некорректный апдейт/JSON: %s", e)
-    except Exception as e:
-        logger.exception("Ошибка обработки апдейта: %s", e)
-        try:
-            await bot.send_message(
-                chat_id="@logginggs",
-                text=f"Ошибка в webhook:\n\n<b>{e}</b>",
-                parse_mode="HTML"
-            )
-        except Exception:
-            pass
-        return web.Response(status=500, text="error")
+        return web.Response(status=200)
+
+    if dedup.is_duplicate(update.update_id):
+        logger.info("Повторный апдейт %s пропущен", update.update_id)
+        return web.Response(status=200)
+
+    update_queue = request.app.get(queue_key)
+    if update_queue is not None:
+        if not await update_queue.put(update):
+            ## every slot of this chat's shard stayed busy: let Telegram retry later
+            dedup.forget(update.update_id)
+            return web.Response(status=503, text="busy")
+        return web.Response(status=200)
+
+    try:
+        await feed_and_report(bot, dp, update)
+    except Exception:
+        ## already logged and reported; the id is marked as seen, so a redelivery
+        ## would be dropped anyway and a 500 would only make Telegram retry for nothing
+        pass
     return web.Response(status=200)
 
 
@@ -111,6 +171,8 @@ async def handle(request: web.Request):
 def create_app() -> web.Application:
     app = web.Application()
     app.router.add_get("/health", health)
+    app.router.add_get("/ready", ready)
+    app.router.add_get("/metrics", metrics)
     app.router.add_post(WEBHOOK_PATH, handle)
 
     app.on_startup.append(on_startup)
@@ -119,7 +181,14 @@ def create_app() -> web.Application:
     return app
 
 async def main():
-    await dp.start_polling(bot)
+    await warm_up_pool()
+    await resume_broadcasts(bot)
+    survey_timer = SurveyTimer(bot)
+    await survey_timer.start()
+    try:
+        await dp.start_polling(bot)
+    finally:
+        await survey_timer.stop()
 
 # -------------------- entrypoint --------------------
 if __name__ == "__main__":
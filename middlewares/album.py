@@ -0,0 +1,67 @@
+import asyncio
+import logging
+import time
+from typing import Callable, Dict, Any, Awaitable
+
+from aiogram import BaseMiddleware
+from aiogram.types import Message
+
+logger = logging.getLogger(__name__)
+
+## an album is complete once no new part arrived for this long
+ALBUM_COLLECT_DELAY = 1.0
+
+
+class AlbumMiddleware(BaseMiddleware):
+    ## album photos arrive as separate messages; in the given FSM states each part returns
+    ## at once so the chat's update queue keeps moving, and the handler runs once for the
+    ## whole album with `album` (photo file ids in order) after the last part
+    def __init__(self, states, delay: float = ALBUM_COLLECT_DELAY):
+        self.states = {getattr(state, "state", state) for state in states}
+        self.delay = delay
+        self._albums: dict[str, dict] = {}
+        self._chats: dict[int, asyncio.Task] = {}
+        self._tasks: set[asyncio.Task] = set()
+
+    async def __call__(
+        self,
+        handler: Callable[[Message, Dict[str, Any]], Awaitable[Any]],
+        event: Message,
+        data: Dict[str, Any],
+    ) -> Any:
+        pending = self._chats.get(event.chat.id)
+        if pending is not None and event.media_group_id not in self._albums:
+            ## a message sent right after an album waits for it, so the album's
+            ## state change happens first; its state is read again afterwards
+            await asyncio.shield(pending)
+            if "state" in data:
+                data["raw_state"] = await data["state"].get_state()
+
+        if not event.media_group_id or not event.photo or data.get("raw_state") not in self.states:
+            return await handler(event, data)
+
+        group_id = event.media_group_id
+        album = self._albums.get(group_id)
+        if album is None:
+            album = self._albums[group_id] = {"parts": [], "handler": handler, "event": event, "data": data}
+            task = asyncio.create_task(self._dispatch(group_id))
+            chat_id = event.chat.id
+            self._chats[chat_id] = task
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+            task.add_done_callback(lambda t: self._chats.pop(chat_id, None) if self._chats.get(chat_id) is t else None)
+        album["parts"].append((event.message_id, event.photo[-1].file_id))
+        album["last"] = time.monotonic()
+
+    async def _dispatch(self, group_id: str) -> None:
+        album = self._albums[group_id]
+        while (wait := album["last"] + self.delay - time.monotonic()) > 0:
+            await asyncio.sleep(wait)
+        del self._albums[group_id]
+
+        data = album["data"]
+        data["album"] = [file_id for _, file_id in sorted(album["parts"])]
+        try:
+            await album["handler"](album["event"], data)
+        except Exception as e:
+            logger.exception("album %s handler failed: %s", group_id, e)
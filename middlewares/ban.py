@@ -1,35 +1,188 @@
 import asyncio
+import copy
+import logging
 import time
+from collections import OrderedDict
 
 from aiogram import BaseMiddleware
 from aiogram.types import Message, CallbackQuery
 from typing import Callable, Dict, Any, Awaitable
 
+from configs import invalidation
 from databases import database as db
 
+logger = logging.getLogger(__name__)
+
 ROLE_BANNED = 5
 
+
+class _FrozenDict(tuple):
+    __slots__ = ()
+
+
+def _freeze(value):
+    ## lists and dicts become tuples, so a record never shares mutable state with a handler
+    if isinstance(value, list):
+        return tuple(_freeze(v) for v in value)
+    if isinstance(value, dict):
+        return _FrozenDict((k, _freeze(v)) for k, v in value.items())
+    return value
+
+
+def _thaw(value):
+    if isinstance(value, _FrozenDict):
+        return {k: _thaw(v) for k, v in value}
+    if isinstance(value, tuple):
+        return [_thaw(v) for v in value]
+    return value
+
+
+class BanRecord:
+    __slots__ = ("banned", "expires", "keys", "values")
+
+    ## key tuples are shared between records, every user from the same endpoint has the same shape
+    _shapes: dict[tuple, tuple] = {}
+
+    def __init__(self, banned: bool, expires: float, user: dict):
+        keys = tuple(user)
+        self.banned = banned
+        self.expires = expires
+        self.keys = self._shapes.setdefault(keys, keys)
+        ## immutable values: a cache hit rebuilds the profile without a deepcopy
+        self.values = tuple(_freeze(v) for v in user.values())
+
+    def user(self) -> dict:
+        ## the profile handed to cmd_start / cmd_bot as data["user"]
+        return {k: _thaw(v) for k, v in zip(self.keys, self.values)}
+
+
+class BanStore:
+    def __init__(self, max_size: int = 20000):
+        self.max_size = max_size
+        self._items: OrderedDict[int, BanRecord] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expired = 0
+
+    def __len__(self):
+        return len(self._items)
+
+    def get(self, uid: int) -> BanRecord | None:
+        record = self._items.get(uid)
+        if record is None:
+            self.misses += 1
+            return None
+        if record.expires < time.monotonic():
+            del self._items[uid]
+            self.expired += 1
+            self.misses += 1
+            return None
+        self._items.move_to_end(uid)
+        self.hits += 1
+        return record
+
+    def set(self, uid: int, record: BanRecord) -> None:
+        self._items[uid] = record
+        self._items.move_to_end(uid)
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+            self.evictions += 1
+
+    def pop(self, uid: int) -> None:
+        self._items.pop(uid, None)
+
+    def sweep(self) -> int:
+        now = time.monotonic()
+        expired = [uid for uid, record in self._items.items() if record.expires < now]
+        for uid in expired:
+            del self._items[uid]
+        self.expired += len(expired)
+        return len(expired)
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._items), "max_size": self.max_size,
+            "hits": self.hits, "misses": self.misses,
+            "evictions": self.evictions, "expired": self.expired,
+        }
+
+
 class BanMiddleware(BaseMiddleware):
-    def __init__(self, ttl_seconds: int = 45, db_timeout: float = 0.6):
+    def __init__(
+        self,
+        ttl_seconds: int = 45,
+        db_timeout: float = 0.6,
+        negative_ttl_seconds: int = 10,
+        max_size: int = 20000,
+        sweep_interval: float = 60,
+    ):
         self.ttl = ttl_seconds
+        self.negative_ttl = negative_ttl_seconds
         self.db_timeout = db_timeout
-        self.cache: dict[int, tuple[bool, float, dict]] = {}
+        self.sweep_interval = sweep_interval
+        self.cache = BanStore(max_size=max_size)
+        self._pending: dict[int, asyncio.Task] = {}
+        self._sweeper: asyncio.Task | None = None
+        invalidation.register("ban", self.cache.pop)
 
     def _cache_get(self, uid: int):
-        item = self.cache.get(uid)
-        if not item:
+        record = self.cache.get(uid)
+        if record is None:
             return None, None
-        is_banned, exp, user = item
-        if exp < time.monotonic():
-            self.cache.pop(uid, None)
-            return None, None
-        return is_banned, user
+        return record.banned, record.user()
 
     def _cache_set(self, uid: int, is_banned: bool, user: dict):
-        self.cache[uid] = (is_banned, time.monotonic() + self.ttl, user or {})
+        ## unregistered users are cached for a shorter time so a fresh signup is picked up quickly
+        ttl = self.ttl if user else self.negative_ttl
+        self.cache.set(uid, BanRecord(is_banned, time.monotonic() + ttl, user or {}))
 
     def invalidate(self, uid: int):
-        self.cache.pop(uid, None)
+        ## the user may sit in the cache of another webhook worker as well
+        invalidation.publish("ban", uid)
+
+    def stats(self) -> dict:
+        return {**self.cache.stats(), "pending": len(self._pending)}
+
+    def _ensure_sweeper(self):
+        if self._sweeper is None or self._sweeper.done():
+            self._sweeper = asyncio.create_task(self._sweep_loop())
+
+    async def _sweep_loop(self):
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            removed = self.cache.sweep()
+            if removed:
+                logger.debug("BanMiddleware swept %s expired entries, %s", removed, self.cache.stats())
+
+    async def close(self):
+        if self._sweeper:
+            self._sweeper.cancel()
+            self._sweeper = None
+
+    async def _fetch(self, uid: int) -> dict:
+        try:
+            user = await db.get_user_by_id(telegram_id=uid)
+            self._cache_set(uid, ROLE_BANNED in (user.get("roles") or []), user)
+            return user
+        finally:
+            self._pending.pop(uid, None)
+
+    async def resolve(self, uid: int) -> tuple[bool | None, dict | None]:
+        is_banned, user = self._cache_get(uid)
+        if is_banned is not None:
+            return is_banned, user
+
+        ## concurrent updates from the same user share one backend lookup
+        task = self._pending.get(uid)
+        if task is None:
+            task = self._pending[uid] = asyncio.create_task(self._fetch(uid))
+        try:
+            user = await asyncio.wait_for(asyncio.shield(task), timeout=self.db_timeout)
+        except Exception:
+            ## slow or failed lookup: let the update through, handlers fetch the user themselves
+            return None, None
+        return ROLE_BANNED in (user.get("roles") or []), copy.deepcopy(user)
 
     async def __call__(
         self,
@@ -44,16 +197,8 @@ class BanMiddleware(BaseMiddleware):
         else:
             return await handler(event, data)
 
-        is_banned, user = self._cache_get(uid)
-
-        if is_banned is None:
-            try:
-                user = await asyncio.wait_for(db.get_user_by_telegram(uid), timeout=self.db_timeout)
-            except Exception:
-                user = {}
-            roles = (user or {}).get("roles") or []
-            is_banned = ROLE_BANNED in roles
-            self._cache_set(uid, is_banned, user)
+        self._ensure_sweeper()
+        is_banned, user = await self.resolve(uid)
 
         data["user"] = user
 
@@ -65,4 +210,4 @@ class BanMiddleware(BaseMiddleware):
                 await event.bot.send_message(event.chat.id, text)
             return  
 
-        return await handler(event, data)
\ No newline at end of file
+        return await handler(event, data)
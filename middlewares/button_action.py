@@ -0,0 +1,18 @@
+from aiogram import BaseMiddleware
+from aiogram.types import Message
+from typing import Callable, Dict, Any, Awaitable
+
+from configs import functions as cf
+
+
+class ButtonActionMiddleware(BaseMiddleware):
+    ## resolves a reply button label once per message; handlers take
+    ## `button_ids` ({role: button id}) and dispatch on the id
+    async def __call__(
+        self,
+        handler: Callable[[Message, Dict[str, Any]], Awaitable[Any]],
+        event: Message,
+        data: Dict[str, Any],
+    ) -> Any:
+        data["button_ids"] = cf.button_actions(event.text)
+        return await handler(event, data)
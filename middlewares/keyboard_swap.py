@@ -0,0 +1,154 @@
+import logging
+import random
+from collections import OrderedDict
+from typing import Callable, Dict, Any, Awaitable
+
+from aiogram import BaseMiddleware, Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramAPIError
+from aiogram.methods import (
+    TelegramMethod, SendMessage, SendPhoto, SendDocument, SendVideo, SendAnimation, SendContact, SendLocation,
+)
+from aiogram.methods.base import TelegramType
+from aiogram.types import (
+    TelegramObject, Message, InlineKeyboardMarkup, ReplyKeyboardMarkup, ReplyKeyboardRemove, ForceReply,
+)
+
+logger = logging.getLogger(__name__)
+
+## methods whose reply_markup can carry a reply-keyboard change
+_SEND_METHODS = (SendMessage, SendPhoto, SendDocument, SendVideo, SendAnimation, SendContact, SendLocation)
+## the old way cost a throwaway send plus its delete on every transition
+_LEGACY_CALLS = 2
+## chats whose keyboard state is remembered; a forgotten chat is assumed to show one
+KEYBOARD_SWAP_MAX_CHATS = 50000
+
+
+class KeyboardSwap:
+    ## a handler asks for the reply keyboard to go away; instead of a throwaway
+    ## message the removal rides on the next message sent to that chat
+    def __init__(self, max_chats: int = KEYBOARD_SWAP_MAX_CHATS):
+        self.max_chats = max_chats
+        self._pending: set[int] = set()
+        ## False only when we know the chat has no reply keyboard shown; least recently used first
+        self._has_keyboard: OrderedDict[int, bool] = OrderedDict()
+        self.stats = {"requested": 0, "skipped": 0, "folded": 0, "edited": 0, "edit_failed": 0, "flushed": 0, "calls_saved": 0}
+
+    def remove_keyboard(self, chat_id: int) -> None:
+        self.stats["requested"] += 1
+        if self._has_keyboard.get(chat_id, True):
+            self._pending.add(chat_id)
+        else:
+            self.stats["skipped"] += 1
+            self.stats["calls_saved"] += _LEGACY_CALLS
+
+    def pending(self, chat_id: int) -> bool:
+        return chat_id in self._pending
+
+    def claim(self, chat_id: int) -> bool:
+        ## True once for a chat with a pending removal
+        if chat_id in self._pending:
+            self._pending.discard(chat_id)
+            return True
+        return False
+
+    def track(self, chat_id: int, markup) -> None:
+        if isinstance(markup, (ReplyKeyboardMarkup, ForceReply)):
+            self._remember(chat_id, True)
+        elif isinstance(markup, ReplyKeyboardRemove):
+            self._remember(chat_id, False)
+
+    def _remember(self, chat_id: int, shown: bool) -> None:
+        self._has_keyboard[chat_id] = shown
+        self._has_keyboard.move_to_end(chat_id)
+        while len(self._has_keyboard) > self.max_chats:
+            self._has_keyboard.popitem(last=False)
+
+    async def flush(self, bot: Bot, chat_id: int) -> None:
+        ## the handler ended without sending anything: fall back to the throwaway message
+        if not self.claim(chat_id):
+            return
+        self.stats["flushed"] += 1
+        from configs.functions import SECRET_MESSAGES
+        msg = await bot.send_message(chat_id, random.choice(SECRET_MESSAGES), reply_markup=ReplyKeyboardRemove())
+        try:
+            await msg.delete()
+        except Exception:
+            pass
+
+    def metrics(self) -> dict:
+        return {**self.stats, "pending": len(self._pending), "tracked_chats": len(self._has_keyboard)}
+
+
+class KeyboardSwapRequestMiddleware(BaseRequestMiddleware):
+    def __init__(self, swap: KeyboardSwap):
+        self.swap = swap
+
+    async def __call__(self, make_request: NextRequestMiddlewareType[TelegramType], bot: Bot,
+                       method: TelegramMethod[TelegramType]) -> TelegramType:
+        if not isinstance(method, _SEND_METHODS) or not isinstance(method.chat_id, int):
+            return await make_request(bot, method)
+
+        chat_id = method.chat_id
+        markup = method.reply_markup
+        if not self.swap.claim(chat_id):
+            self.swap.track(chat_id, markup)
+            return await make_request(bot, method)
+
+        if isinstance(markup, (ReplyKeyboardMarkup, ReplyKeyboardRemove, ForceReply)):
+            ## the new reply keyboard replaces the old one by itself
+            self.swap.stats["folded"] += 1
+            self.swap.stats["calls_saved"] += _LEGACY_CALLS
+            self.swap.track(chat_id, markup)
+            return await make_request(bot, method)
+
+        method.reply_markup = ReplyKeyboardRemove()
+        self.swap.track(chat_id, method.reply_markup)
+        sent = await make_request(bot, method)
+        if not isinstance(markup, InlineKeyboardMarkup):
+            self.swap.stats["folded"] += 1
+            self.swap.stats["calls_saved"] += _LEGACY_CALLS
+            return sent
+
+        ## a message cannot remove the reply keyboard and carry inline buttons at once:
+        ## send it with the removal and attach the inline keyboard with one edit
+        if not isinstance(sent, Message):
+            return sent
+        from configs.broadcast import send_limited
+        try:
+            edited = await send_limited(bot.edit_message_reply_markup, chat_id=chat_id, message_id=sent.message_id, reply_markup=markup)
+            self.swap.stats["edited"] += 1
+            self.swap.stats["calls_saved"] += _LEGACY_CALLS - 1
+            return edited if isinstance(edited, Message) else sent
+        except TelegramAPIError as e:
+            logger.warning("keyboard swap: inline keyboard edit failed for %s: %s", chat_id, e)
+
+        ## the message must not stay without its buttons: replace it with one carrying the real markup
+        self.swap.stats["edit_failed"] += 1
+        try:
+            await send_limited(bot.delete_message, chat_id=chat_id, message_id=sent.message_id)
+        except TelegramAPIError:
+            pass
+        method.reply_markup = markup
+        return await send_limited(make_request, bot, method)
+
+
+class KeyboardSwapFlushMiddleware(BaseMiddleware):
+    def __init__(self, swap: KeyboardSwap):
+        self.swap = swap
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        try:
+            return await handler(event, data)
+        finally:
+            chat = data.get("event_chat")
+            if chat is not None and self.swap.pending(chat.id):
+                await self.swap.flush(data["bot"], chat.id)
+
+
+keyboard_swap = KeyboardSwap()